@@ -11,14 +11,150 @@ import numpy as np
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 import argparse
-from collections import defaultdict
+from collections import Counter, defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import functools
 import shutil
+import threading
+import time
+
+# orjson opzionale: lettura/scrittura JSON delle annotazioni piu' veloce
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# imagesize opzionale: dimensioni lette dall'header, senza decodificare i pixel
+try:
+    import imagesize
+    IMAGESIZE_AVAILABLE = True
+except ImportError:
+    imagesize = None
+    IMAGESIZE_AVAILABLE = False
+
+# Numba opzionale: helper geometrici compilati
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _load_json_file(path) -> Dict:
+    """Legge un file JSON in un'unica read()"""
+    data = Path(path).read_bytes()
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dump_json_bytes(obj, indent: bool = False) -> bytes:
+    """Serializza obj in bytes, pronto per una singola write()"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _nearest_center(cx, cy, x, y, radius_sq):
+        """Indice del centro piu' vicino a (x, y) entro radius_sq, -1 se nessuno"""
+        best = -1
+        best_d = radius_sq
+        for i in range(cx.shape[0]):
+            d = (cx[i] - x) ** 2 + (cy[i] - y) ** 2
+            if d < best_d:
+                best_d = d
+                best = i
+        return best
+else:
+    def _nearest_center(cx, cy, x, y, radius_sq):
+        """Indice del centro piu' vicino a (x, y) entro radius_sq, -1 se nessuno"""
+        dist_sq = (cx - x) ** 2 + (cy - y) ** 2
+        best = int(dist_sq.argmin())
+        return best if dist_sq[best] < radius_sq else -1
+
+
+def _write_bytes_atomic(path: Path, data: bytes):
+    """Scrive su un file temporaneo nella stessa directory e lo rinomina su path"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _metadata_blob(metadata: Dict) -> bytes:
+    """Contenuto confrontabile dei metadati, escluso il timestamp di modifica"""
+    return _dump_json_bytes({k: v for k, v in metadata.items() if k != 'last_modified'})
+
+
+@functools.lru_cache(maxsize=512)
+def _text_size(text: str, font: int, scale: float, thickness: int) -> Tuple[Tuple[int, int], int]:
+    """cv2.getTextSize memoizzato: dipende solo dagli argomenti"""
+    return cv2.getTextSize(text, font, scale, thickness)
+
+
+@functools.lru_cache(maxsize=256)
+def _render_label(text: str, color: Tuple[int, int, int]) -> Tuple[np.ndarray, np.ndarray, int, int]:
+    """Etichetta bbox (sfondo colorato + testo bianco) pre-renderizzata fuori schermo.
+
+    Restituisce (tile, mask, dx, dy): la maschera marca i pixel disegnati e
+    (dx, dy) e' lo scostamento dell'angolo del tile rispetto a (x1, y1).
+    I tile sono condivisi dalla cache: sola lettura.
+    """
+    (tw, th), baseline = _text_size(text, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+    # Margine per il testo che sborda dallo sfondo (discendenti, spessore)
+    pad = baseline + 4
+    ox, oy = pad, pad + th + 10
+    tile_h, tile_w = oy + pad + 1, ox + tw + 5 + pad + 1
+
+    tile = np.zeros((tile_h, tile_w, 3), dtype=np.uint8)
+    mask = np.zeros((tile_h, tile_w), dtype=np.uint8)
+    for dst, ink, text_ink in ((tile, color, (255, 255, 255)), (mask, 255, 255)):
+        cv2.rectangle(dst, (ox, oy - th - 10), (ox + tw + 5, oy), ink, -1)
+        cv2.putText(dst, text, (ox + 2, oy - 5),
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_ink, 2)
+    mask = mask.astype(bool)[..., None]
+    tile.flags.writeable = False
+    mask.flags.writeable = False
+    return tile, mask, -ox, -oy
+
 
 class JewelryBatchAnnotator:
-    def __init__(self, dataset_dir: str = "~/jewelry_vision/dataset"):
+    # Salvataggi tra due riscritture di progress_index.json
+    INDEX_FLUSH_EVERY = 20
+    
+    # Immagini decodificate tenute in memoria (corrente + vicine precaricate)
+    IMAGE_CACHE_SIZE = 8
+    
+    # Lato massimo visualizzato: oltre il doppio la decodifica avviene a meta' risoluzione
+    MAX_DISPLAY_SIDE = 1200
+    
+    # Intervallo minimo (s) tra due ridisegni causati da MOUSEMOVE (~60 Hz)
+    MOUSEMOVE_INTERVAL = 0.016
+    
+    # Colore (BGR) per categoria
+    CATEGORY_COLORS = (
+        (0, 255, 255),    # anello - giallo
+        (255, 0, 255),    # collana - magenta
+        (0, 255, 0),      # orecchino - verde
+        (255, 0, 0),      # braccialetto - rosso
+        (0, 128, 255),    # pendente - arancione
+        (255, 255, 0),    # spilla - ciano
+        (128, 0, 255),    # gemma - viola
+        (255, 128, 0),    # orologio - blu chiaro
+    )
+    
+    def __init__(self, dataset_dir: str = "~/jewelry_vision/dataset", reduced_decode: bool = True):
         self.dataset_dir = Path(dataset_dir).expanduser()
         self.raw_images_dir = self.dataset_dir / "images/raw"
         self.annotations_dir = self.dataset_dir / "annotations/temp"
+        # Fuori da annotations/temp: gli altri tool trattano ogni *.json li' come annotazione
+        self.index_path = self.dataset_dir / "annotations/progress_index.json"
         
         # Categorie gioielli
         self.categories = {
@@ -29,7 +165,15 @@ class JewelryBatchAnnotator:
         # UI State
         self.current_image_idx = 0
         self.images_list = []
+        # Nomi, stem e JSON per indice, calcolati una volta in load_images
+        self._names: List[str] = []
+        self._stems: List[str] = []
+        self._json_paths: List[Path] = []
         self.current_image = None
+        # Fattore tra coordinate immagine (bbox salvate) e display, e dimensioni originali
+        self.reduced_decode = reduced_decode and IMAGESIZE_AVAILABLE
+        self._display_scale = 1
+        self._image_size = None
         self.current_filename = ""
         self.current_metadata = {}
         
@@ -38,10 +182,36 @@ class JewelryBatchAnnotator:
         self.current_bbox = None
         self.drawing = False
         self.selected_category = 0
+        self._bbox_centers = None  # (cx, cy) delle bbox, None se da ricalcolare
+        
+        # Cache rendering UI
+        self._panel_cache = {}  # larghezza -> sfondo pannello info
+        self._dirty = True  # UI da ridisegnare al prossimo giro del loop
+        self._back_buffer = None
+        self._last_move = 0.0  # time.monotonic() dell'ultimo MOUSEMOVE ridisegnato
+        self._move_pending = False  # posizione aggiornata ma non ancora ridisegnata
+        
+        # Cache LRU delle immagini decodificate e prefetch delle vicine
+        self._img_cache = OrderedDict()  # Path -> (np.ndarray mai modificato, scala, (h, w))
+        self._img_pending = {}  # Path -> Future di _decode_image
+        self._img_cache_lock = threading.Lock()
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=2)
         
         # Stats
         self.session_stats = defaultdict(int)
         self.annotation_progress = {}
+        self._annotated_count = 0  # immagini con progresso vero, aggiornato a ogni salvataggio
+        
+        # Indice aggregato del progresso, riscritto ogni INDEX_FLUSH_EVERY salvataggi
+        self._index_dirty = False
+        self._saves_since_index_flush = 0
+        
+        # Ultimo contenuto (senza timestamp) letto o scritto per ogni immagine
+        self._last_saved_blob = {}
+        
+        # Bbox per categoria: totale e contributo di ogni immagine (None finche' non scansionati)
+        self._category_counts = Counter()
+        self._image_category_counts = None
         
         self.load_images()
         
@@ -51,34 +221,87 @@ class JewelryBatchAnnotator:
             print(f"❌ Directory immagini non trovata: {self.raw_images_dir}")
             return
             
-        # Carica tutte le immagini
-        extensions = ['*.jpg', '*.jpeg', '*.png']
-        for ext in extensions:
-            self.images_list.extend(self.raw_images_dir.glob(ext))
+        # Carica tutte le immagini (un solo passaggio sulla directory). Estensioni
+        # case-sensitive come in dataset_manager: un .JPG non e' un'immagine per nessuno dei due
+        extensions = ('.jpg', '.jpeg', '.png')
+        with os.scandir(self.raw_images_dir) as it:
+            self.images_list.extend(
+                Path(entry.path) for entry in it
+                if entry.is_file() and entry.name.endswith(extensions)
+            )
             
-        self.images_list.sort()
+        self.images_list.sort(key=lambda p: p.name)
+        self._names = [p.name for p in self.images_list]
+        self._stems = [p.stem for p in self.images_list]
+        self._json_paths = [self.annotations_dir / f"{stem}.json" for stem in self._stems]
         
         # Carica progresso esistente
         self.load_annotation_progress()
         
         print(f"📁 Trovate {len(self.images_list)} immagini")
-        print(f"✅ Annotate: {len([x for x in self.annotation_progress.values() if x])}")
-        print(f"⏳ Da annotare: {len([x for x in self.annotation_progress.values() if not x])}")
+        print(f"✅ Annotate: {self._annotated_count}")
+        print(f"⏳ Da annotare: {len(self.annotation_progress) - self._annotated_count}")
         
     def load_annotation_progress(self):
         """Carica progresso annotazioni esistente"""
-        for img_path in self.images_list:
-            json_path = self.annotations_dir / f"{img_path.stem}.json"
-            
-            if json_path.exists():
-                try:
-                    with open(json_path, 'r') as f:
-                        metadata = json.load(f)
-                    self.annotation_progress[img_path.name] = metadata.get('annotation_complete', False)
-                except:
-                    self.annotation_progress[img_path.name] = False
+        # Indice aggregato: evita di aprire un JSON per immagine a ogni avvio
+        index = {}
+        index_mtime_ns = 0
+        if self.index_path.exists():
+            try:
+                index_mtime_ns = self.index_path.stat().st_mtime_ns
+                index = _load_json_file(self.index_path)
+            except:
+                index = {}
+        
+        # Un solo listing della directory: JSON presenti e quelli modificati dopo l'indice
+        sidecar_stems = set()
+        stale_stems = set()
+        if self.annotations_dir.exists():
+            with os.scandir(self.annotations_dir) as it:
+                for entry in it:
+                    if entry.name.endswith('.json'):
+                        stem = entry.name[:-5]
+                        sidecar_stems.add(stem)
+                        if index and entry.stat().st_mtime_ns >= index_mtime_ns:
+                            stale_stems.add(stem)
+        
+        self.annotation_progress = {}
+        for name, stem, json_path in zip(self._names, self._stems, self._json_paths):
+            if stem not in sidecar_stems:
+                self.annotation_progress[name] = False
+            elif name in index and stem not in stale_stems:
+                self.annotation_progress[name] = bool(index[name])
             else:
-                self.annotation_progress[img_path.name] = False
+                # Non indicizzata o JSON piu' recente dell'indice: rilegge il file
+                self.annotation_progress[name] = self._read_annotation_complete(json_path)
+        
+        self._annotated_count = sum(map(bool, self.annotation_progress.values()))
+        
+        if self.annotation_progress != index:
+            self._index_dirty = True
+            self.flush_progress_index()
+                
+    def _read_annotation_complete(self, json_path: Path) -> bool:
+        """Legge il flag annotation_complete dal JSON dell'immagine"""
+        if json_path.exists():
+            try:
+                metadata = _load_json_file(json_path)
+                return metadata.get('annotation_complete', False)
+            except:
+                return False
+        return False
+        
+    def flush_progress_index(self):
+        """Scrive l'indice del progresso in modo atomico"""
+        if not self._index_dirty:
+            return
+            
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        _write_bytes_atomic(self.index_path, _dump_json_bytes(self.annotation_progress))
+        
+        self._index_dirty = False
+        self._saves_since_index_flush = 0
                 
     def load_current_image(self):
         """Carica immagine corrente"""
@@ -86,20 +309,26 @@ class JewelryBatchAnnotator:
             return False
             
         img_path = self.images_list[self.current_image_idx]
-        self.current_filename = img_path.name
+        self.current_filename = self._names[self.current_image_idx]
         
-        # Carica immagine
-        self.current_image = cv2.imread(str(img_path))
-        if self.current_image is None:
+        # Carica immagine (dalla cache se gia' decodificata o precaricata)
+        decoded = self._read_image(img_path)
+        if decoded is None:
+            self.current_image = None
             print(f"❌ Errore caricamento: {img_path}")
             return False
+        self.current_image, self._display_scale, self._image_size = decoded
+            
+        # Back-buffer per il rendering, riallocato solo se cambiano le dimensioni
+        if self._back_buffer is None or self._back_buffer.shape != self.current_image.shape:
+            self._back_buffer = np.empty_like(self.current_image)
             
         # Carica metadati esistenti
-        json_path = self.annotations_dir / f"{img_path.stem}.json"
+        json_path = self._json_paths[self.current_image_idx]
         
         if json_path.exists():
-            with open(json_path, 'r') as f:
-                self.current_metadata = json.load(f)
+            self.current_metadata = _load_json_file(json_path)
+            self._last_saved_blob[self.current_filename] = _metadata_blob(self.current_metadata)
                 
             # Carica bbox esistenti
             if 'bboxes' in self.current_metadata:
@@ -119,38 +348,124 @@ class JewelryBatchAnnotator:
             # Crea metadati base
             self.current_metadata = {
                 'filename': self.current_filename,
-                'image_size': list(self.current_image.shape[:2]),
+                'image_size': list(self._image_size),
                 'bboxes': [],
                 'annotation_complete': False
             }
             self.bboxes = []
             
+        self._bbox_centers = None
+        self._dirty = True
+        self._prefetch_neighbors()
         return True
         
+    def _decode_image(self, img_path: Path) -> Optional[Tuple[np.ndarray, int, Tuple[int, int]]]:
+        """Decodifica l'immagine: (pixel, scala display, (h, w) originali) o None
+        
+        Le immagini molto piu' grandi della finestra sono decodificate a meta'
+        risoluzione (IDCT ridotta per i JPEG); le bbox restano in coordinate
+        dell'immagine originale.
+        """
+        if self.reduced_decode:
+            img_w, img_h = imagesize.get(str(img_path))
+            if max(img_w, img_h) > 2 * self.MAX_DISPLAY_SIDE:
+                image = cv2.imread(str(img_path), cv2.IMREAD_REDUCED_COLOR_2)
+                if image is None:
+                    return None
+                # L'header non tiene conto dell'orientamento EXIF applicato da imread
+                if image.shape[1] not in (img_w // 2, (img_w + 1) // 2):
+                    img_w, img_h = img_h, img_w
+                return image, 2, (img_h, img_w)
+                
+        image = cv2.imread(str(img_path))
+        if image is None:
+            return None
+        return image, 1, image.shape[:2]
+        
+    def _read_image(self, img_path: Path) -> Optional[Tuple[np.ndarray, int, Tuple[int, int]]]:
+        """Immagine decodificata, dalla cache LRU o da disco"""
+        with self._img_cache_lock:
+            decoded = self._img_cache.get(img_path)
+            if decoded is not None:
+                self._img_cache.move_to_end(img_path)
+                return decoded
+            future = self._img_pending.pop(img_path, None)
+            
+        decoded = future.result() if future is not None else self._decode_image(img_path)
+        if decoded is not None:
+            self._cache_image(img_path, decoded)
+        return decoded
+        
+    def _cache_image(self, img_path: Path, decoded: Tuple[np.ndarray, int, Tuple[int, int]]):
+        """Inserisce in cache, scartando le immagini meno recenti"""
+        with self._img_cache_lock:
+            self._img_cache[img_path] = decoded
+            self._img_cache.move_to_end(img_path)
+            while len(self._img_cache) > self.IMAGE_CACHE_SIZE:
+                self._img_cache.popitem(last=False)
+                
+    def _on_prefetched(self, img_path: Path, future):
+        """Callback del prefetch: sposta il risultato in cache"""
+        with self._img_cache_lock:
+            if self._img_pending.get(img_path) is not future:
+                return  # gia' consumato da _read_image
+            del self._img_pending[img_path]
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            self._cache_image(img_path, future.result())
+            
+    def _prefetch_neighbors(self):
+        """Decodifica in background l'immagine successiva e la precedente"""
+        for idx in (self.current_image_idx + 1, self.current_image_idx - 1):
+            if not 0 <= idx < len(self.images_list):
+                continue
+            img_path = self.images_list[idx]
+            with self._img_cache_lock:
+                if img_path in self._img_cache or img_path in self._img_pending:
+                    continue
+                future = self._prefetch_pool.submit(self._decode_image, img_path)
+                self._img_pending[img_path] = future
+            future.add_done_callback(functools.partial(self._on_prefetched, img_path))
+        
     def save_current_annotation(self):
         """Salva annotazione corrente"""
         if not self.current_image_idx < len(self.images_list):
             return
             
-        img_path = self.images_list[self.current_image_idx]
-        json_path = self.annotations_dir / f"{img_path.stem}.json"
+        json_path = self._json_paths[self.current_image_idx]
         
         # Aggiorna metadati
         self.current_metadata.update({
             'filename': self.current_filename,
-            'image_size': list(self.current_image.shape[:2]),
+            'image_size': list(self._image_size),
             'bboxes': self.bboxes,
-            'annotation_complete': len(self.bboxes) > 0,
-            'last_modified': str(Path.ctime(Path.now()))
+            'annotation_complete': len(self.bboxes) > 0
         })
         
-        # Salva JSON
-        json_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(json_path, 'w') as f:
-            json.dump(self.current_metadata, f, indent=2)
+        # Salva JSON solo se il contenuto e' cambiato dall'ultima lettura/scrittura
+        blob = _metadata_blob(self.current_metadata)
+        if self._last_saved_blob.get(self.current_filename) != blob:
+            self.current_metadata['last_modified'] = int(time.time())
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            _write_bytes_atomic(json_path, _dump_json_bytes(self.current_metadata, indent=True))
+            self._last_saved_blob[self.current_filename] = blob
+            
+            # Conteggi per categoria: sostituisce il contributo precedente dell'immagine
+            if self._image_category_counts is not None:
+                new_counts = Counter(bbox_data['category'] for bbox_data in self.bboxes)
+                self._category_counts.subtract(self._image_category_counts.get(self.current_filename, Counter()))
+                self._category_counts.update(new_counts)
+                self._image_category_counts[self.current_filename] = new_counts
             
         # Aggiorna progresso
-        self.annotation_progress[self.current_filename] = len(self.bboxes) > 0
+        annotated = len(self.bboxes) > 0
+        previous = self.annotation_progress.get(self.current_filename)
+        if previous != annotated:
+            self.annotation_progress[self.current_filename] = annotated
+            self._annotated_count += annotated - bool(previous)
+            self._index_dirty = True
+            self._saves_since_index_flush += 1
+            if self._saves_since_index_flush >= self.INDEX_FLUSH_EVERY:
+                self.flush_progress_index()
         
         # Aggiorna stats sessione
         self.session_stats['annotated'] += 1
@@ -160,15 +475,29 @@ class JewelryBatchAnnotator:
             
     def mouse_callback(self, event, x, y, flags, param):
         """Callback mouse per disegnare bbox"""
+        # Da coordinate display a coordinate dell'immagine originale
+        s = self._display_scale
+        x, y = x * s, y * s
+        
         if event == cv2.EVENT_LBUTTONDOWN:
             self.drawing = True
             self.current_bbox = {'start': (x, y), 'end': (x, y)}
+            self._dirty = True
             
         elif event == cv2.EVENT_MOUSEMOVE and self.drawing:
+            # La posizione si registra sempre (serve al rilascio), il ridisegno al massimo a ~60 Hz
             self.current_bbox['end'] = (x, y)
+            now = time.monotonic()
+            if now - self._last_move < self.MOUSEMOVE_INTERVAL:
+                self._move_pending = True
+                return
+            self._last_move = now
+            self._move_pending = False
+            self._dirty = True
             
         elif event == cv2.EVENT_LBUTTONUP and self.drawing:
             self.drawing = False
+            self._dirty = True
             
             if self.current_bbox:
                 # Calcola bbox finale
@@ -179,44 +508,48 @@ class JewelryBatchAnnotator:
                 x1, x2 = min(x1, x2), max(x1, x2)
                 y1, y2 = min(y1, y2), max(y1, y2)
                 
-                # Verifica dimensioni minime
-                if abs(x2 - x1) > 10 and abs(y2 - y1) > 10:
+                # Verifica dimensioni minime (in pixel a schermo)
+                if abs(x2 - x1) > 10 * s and abs(y2 - y1) > 10 * s:
                     bbox_data = {
                         'bbox': [x1, y1, x2, y2],
                         'category_id': self.selected_category,
                         'category': self.categories[self.selected_category]
                     }
                     self.bboxes.append(bbox_data)
+                    self._bbox_centers = None
                     print(f"➕ Aggiunto bbox: {self.categories[self.selected_category]}")
                     
                 self.current_bbox = None
                 
         elif event == cv2.EVENT_RBUTTONDOWN:
-            # Click destro - rimuovi bbox vicino
-            min_dist = float('inf')
-            remove_idx = -1
-            
-            for i, bbox_data in enumerate(self.bboxes):
-                x1, y1, x2, y2 = bbox_data['bbox']
-                center_x, center_y = (x1 + x2) // 2, (y1 + y2) // 2
-                dist = ((x - center_x) ** 2 + (y - center_y) ** 2) ** 0.5
+            # Click destro - rimuovi bbox vicino (entro 50 pixel dal centro)
+            if not self.bboxes:
+                return
+                
+            centers = self._bbox_centers
+            if centers is None:
+                boxes = np.array([b['bbox'] for b in self.bboxes])
+                centers = ((boxes[:, 0] + boxes[:, 2]) // 2, (boxes[:, 1] + boxes[:, 3]) // 2)
+                self._bbox_centers = centers
                 
-                if dist < min_dist and dist < 50:  # Raggio di 50 pixel
-                    min_dist = dist
-                    remove_idx = i
+            remove_idx = _nearest_center(centers[0], centers[1], x, y, (50 * s) ** 2)
                     
             if remove_idx >= 0:
                 removed = self.bboxes.pop(remove_idx)
+                self._bbox_centers = None
+                self._dirty = True
                 print(f"➖ Rimosso bbox: {removed['category']}")
                 
-    def draw_ui_overlay(self, image: np.ndarray) -> np.ndarray:
-        """Disegna overlay UI"""
-        overlay = image.copy()
-        h, w = image.shape[:2]
+    def draw_ui_overlay(self, canvas: np.ndarray) -> np.ndarray:
+        """Disegna overlay UI in place su canvas (il back-buffer del chiamante) e lo restituisce"""
+        h, w = canvas.shape[:2]
+        s = self._display_scale
         
-        # Disegna bbox esistenti
+        # Disegna bbox esistenti (coordinate immagine riportate a quelle display)
         for i, bbox_data in enumerate(self.bboxes):
             x1, y1, x2, y2 = bbox_data['bbox']
+            if s != 1:
+                x1, y1, x2, y2 = x1 // s, y1 // s, x2 // s, y2 // s
             category = bbox_data['category']
             category_id = bbox_data['category_id']
             
@@ -224,36 +557,38 @@ class JewelryBatchAnnotator:
             color = self.get_category_color(category_id)
             
             # Disegna rettangolo
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), color, 2)
             
-            # Label
-            label = f"{i+1}: {category}"
-            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)[0]
-            cv2.rectangle(overlay, (x1, y1 - label_size[1] - 10), 
-                         (x1 + label_size[0] + 5, y1), color, -1)
-            cv2.putText(overlay, label, (x1 + 2, y1 - 5), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+            # Label: tile pre-renderizzato copiato nella slice, ritagliato ai bordi
+            tile, mask, dx, dy = _render_label(f"{i+1}: {category}", color)
+            tx, ty = x1 + dx, y1 + dy
+            sx, sy = max(tx, 0), max(ty, 0)
+            ex, ey = min(tx + tile.shape[1], w), min(ty + tile.shape[0], h)
+            if sx < ex and sy < ey:
+                np.copyto(canvas[sy:ey, sx:ex], tile[sy - ty:ey - ty, sx - tx:ex - tx],
+                          where=mask[sy - ty:ey - ty, sx - tx:ex - tx])
         
         # Disegna bbox in creazione
         if self.drawing and self.current_bbox:
             x1, y1 = self.current_bbox['start']
             x2, y2 = self.current_bbox['end']
             color = self.get_category_color(self.selected_category)
-            cv2.rectangle(overlay, (x1, y1), (x2, y2), color, 2)
+            cv2.rectangle(canvas, (x1 // s, y1 // s), (x2 // s, y2 // s), color, 2)
             
         # Pannello informazioni
-        self.draw_info_panel(overlay)
+        self.draw_info_panel(canvas)
         
-        return overlay
+        return canvas
         
     def draw_info_panel(self, image: np.ndarray):
         """Disegna pannello informazioni"""
         h, w = image.shape[:2]
         
-        # Background pannello
+        # Background pannello con la riga comandi gia' disegnata, copiato
+        # direttamente sull'immagine: il testo dinamico va disegnato sulla view
         panel_h = 150
-        panel = np.zeros((panel_h, w, 3), dtype=np.uint8)
-        panel[:] = (40, 40, 40)
+        image[:panel_h] = self._get_static_panel(w, panel_h)
+        panel = image[:panel_h]
         
         # Info immagine corrente
         progress = f"{self.current_image_idx + 1}/{len(self.images_list)}"
@@ -277,17 +612,13 @@ class JewelryBatchAnnotator:
         cv2.putText(panel, status, (10, 100), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, status_color, 2)
         
-        # Comandi
-        commands = "SPACE=Next | BACKSPACE=Prev | S=Save | 1-8=Category | C=Clear | Q=Quit"
-        cv2.putText(panel, commands, (10, 125), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
-        
-        # Statistiche laterali
+        # Statistiche laterali (l'intestazione puo' sovrapporsi al nome file:
+        # resta qui per mantenere l'ordine di disegno)
         stats_x = w - 200
         cv2.putText(panel, "STATS SESSIONE:", (stats_x, 25), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
         
-        annotated = len([x for x in self.annotation_progress.values() if x])
+        annotated = self._annotated_count
         total = len(self.annotation_progress)
         cv2.putText(panel, f"Annotate: {annotated}/{total}", (stats_x, 45), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
@@ -297,22 +628,25 @@ class JewelryBatchAnnotator:
             cv2.putText(panel, f"Progresso: {progress_pct:.1f}%", (stats_x, 65), 
                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         
-        # Sovrapponi pannello
-        image[:panel_h] = panel
+    def _get_static_panel(self, w: int, panel_h: int) -> np.ndarray:
+        """Sfondo del pannello con la riga comandi, costruito una volta per larghezza"""
+        panel = self._panel_cache.get(w)
+        if panel is not None:
+            return panel
+            
+        panel = np.full((panel_h, w, 3), 40, dtype=np.uint8)
+        
+        # Comandi
+        commands = "SPACE=Next | BACKSPACE=Prev | S=Save | 1-8=Category | C=Clear | Q=Quit"
+        cv2.putText(panel, commands, (10, 125), 
+                   cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
+        
+        self._panel_cache[w] = panel
+        return panel
         
     def get_category_color(self, category_id: int) -> Tuple[int, int, int]:
         """Restituisce colore per categoria"""
-        colors = [
-            (0, 255, 255),    # anello - giallo
-            (255, 0, 255),    # collana - magenta
-            (0, 255, 0),      # orecchino - verde
-            (255, 0, 0),      # braccialetto - rosso
-            (0, 128, 255),    # pendente - arancione
-            (255, 255, 0),    # spilla - ciano
-            (128, 0, 255),    # gemma - viola
-            (255, 128, 0),    # orologio - blu chiaro
-        ]
-        return colors[category_id % len(colors)]
+        return self.CATEGORY_COLORS[category_id % len(self.CATEGORY_COLORS)]
         
     def next_image(self):
         """Passa alla prossima immagine"""
@@ -335,6 +669,7 @@ class JewelryBatchAnnotator:
     def clear_annotations(self):
         """Cancella tutte le annotazioni correnti"""
         self.bboxes = []
+        self._bbox_centers = None
         print("🗑️  Annotazioni cancellate")
         
     def jump_to_next_unannotated(self):
@@ -342,7 +677,7 @@ class JewelryBatchAnnotator:
         start_idx = self.current_image_idx
         
         for i in range(start_idx + 1, len(self.images_list)):
-            img_name = self.images_list[i].name
+            img_name = self._names[i]
             if not self.annotation_progress.get(img_name, False):
                 self.save_current_annotation()
                 self.current_image_idx = i
@@ -352,7 +687,7 @@ class JewelryBatchAnnotator:
                 
         # Se non trovate, ricomincia dall'inizio
         for i in range(0, start_idx):
-            img_name = self.images_list[i].name
+            img_name = self._names[i]
             if not self.annotation_progress.get(img_name, False):
                 self.save_current_annotation()
                 self.current_image_idx = i
@@ -363,6 +698,54 @@ class JewelryBatchAnnotator:
         print("✅ Tutte le immagini sono state annotate!")
         return False
         
+    def _image_shape(self, img_path: Path, metadata: Dict) -> Optional[Tuple[int, int]]:
+        """(h, w) dell'immagine: dai metadati se presenti, altrimenti dall'header; None se illeggibile"""
+        if metadata.get('image_size'):
+            img_h, img_w = metadata['image_size']
+            return img_h, img_w
+            
+        img_w, img_h = imagesize.get(str(img_path)) if IMAGESIZE_AVAILABLE else (-1, -1)
+        if img_w <= 0 or img_h <= 0:
+            # Formato non riconosciuto dall'header: decodifica completa
+            image = cv2.imread(str(img_path))
+            if image is None:
+                return None
+            img_h, img_w = image.shape[:2]
+            
+        metadata['image_size'] = [img_h, img_w]
+        return img_h, img_w
+        
+    def _export_one(self, img_path: Path, stem: str, json_path: Path, yolo_dir: Path) -> int:
+        """Esporta l'annotazione YOLO di una immagine; 1 se esportata, 0 altrimenti"""
+        if not json_path.exists():
+            return 0
+            
+        metadata = _load_json_file(json_path)
+            
+        if not metadata.get('bboxes'):
+            return 0
+            
+        # Crea file annotazione YOLO
+        yolo_file = yolo_dir / f"{stem}.txt"
+        shape = self._image_shape(img_path, metadata)
+        if shape is None:
+            print(f"⚠️ Immagine illeggibile, annotazione non esportata: {img_path.name}")
+            return 0
+        img_h, img_w = shape
+        
+        # Converti in formato YOLO (normalizzato), tutte le bbox insieme
+        boxes = np.asarray([b['bbox'] for b in metadata['bboxes']], dtype=np.float64)
+        category_ids = np.asarray([b['category_id'] for b in metadata['bboxes']], dtype=np.float64)
+        
+        center_x = (boxes[:, 0] + boxes[:, 2]) / 2.0 / img_w
+        center_y = (boxes[:, 1] + boxes[:, 3]) / 2.0 / img_h
+        width = (boxes[:, 2] - boxes[:, 0]) / img_w
+        height = (boxes[:, 3] - boxes[:, 1]) / img_h
+        
+        yolo_rows = np.column_stack([category_ids, center_x, center_y, width, height])
+        np.savetxt(yolo_file, yolo_rows, fmt="%d %.6f %.6f %.6f %.6f")
+        return 1
+        
     def export_annotations(self):
         """Esporta tutte le annotazioni in formato YOLO"""
         print("🔄 Esportazione annotazioni in formato YOLO...")
@@ -370,39 +753,12 @@ class JewelryBatchAnnotator:
         yolo_dir = self.dataset_dir / "annotations/yolo"
         yolo_dir.mkdir(parents=True, exist_ok=True)
         
-        exported_count = 0
-        
-        for img_path in self.images_list:
-            json_path = self.annotations_dir / f"{img_path.stem}.json"
-            
-            if not json_path.exists():
-                continue
-                
-            with open(json_path, 'r') as f:
-                metadata = json.load(f)
-                
-            if not metadata.get('bboxes'):
-                continue
-                
-            # Crea file annotazione YOLO
-            yolo_file = yolo_dir / f"{img_path.stem}.txt"
-            
-            with open(yolo_file, 'w') as f:
-                img_h, img_w = metadata['image_size']
-                
-                for bbox_data in metadata['bboxes']:
-                    x1, y1, x2, y2 = bbox_data['bbox']
-                    category_id = bbox_data['category_id']
-                    
-                    # Converti in formato YOLO (normalizzato)
-                    center_x = (x1 + x2) / 2.0 / img_w
-                    center_y = (y1 + y2) / 2.0 / img_h
-                    width = (x2 - x1) / img_w
-                    height = (y2 - y1) / img_h
-                    
-                    f.write(f"{category_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
-                    
-            exported_count += 1
+        # File indipendenti: I/O e conversione sovrapposti su piu' thread
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            exported_count = sum(ex.map(
+                lambda args: self._export_one(*args, yolo_dir),
+                zip(self.images_list, self._stems, self._json_paths)
+            ))
             
         # Genera file classes.txt
         classes_file = yolo_dir / "classes.txt"
@@ -413,6 +769,22 @@ class JewelryBatchAnnotator:
         print(f"✅ Esportate {exported_count} annotazioni YOLO")
         print(f"📁 Directory: {yolo_dir}")
         
+    def _scan_category_counts(self):
+        """Legge in parallelo tutti i JSON e conta le bbox per categoria"""
+        def count_one(json_path: Path) -> Counter:
+            if not json_path.exists():
+                return Counter()
+            metadata = _load_json_file(json_path)
+            return Counter(bbox_data['category'] for bbox_data in metadata.get('bboxes', []))
+            
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            per_image = list(ex.map(count_one, self._json_paths))
+            
+        self._image_category_counts = dict(zip(self._names, per_image))
+        self._category_counts = Counter()
+        for counts in per_image:
+            self._category_counts.update(counts)
+            
     def print_statistics(self):
         """Stampa statistiche dettagliate"""
         print("\n" + "="*60)
@@ -420,7 +792,7 @@ class JewelryBatchAnnotator:
         print("="*60)
         
         total_images = len(self.images_list)
-        annotated = len([x for x in self.annotation_progress.values() if x])
+        annotated = self._annotated_count
         
         print(f"Immagini totali: {total_images}")
         print(f"Immagini annotate: {annotated}")
@@ -430,20 +802,12 @@ class JewelryBatchAnnotator:
             progress = (annotated / total_images) * 100
             print(f"Progresso: {progress:.1f}%")
             
-        # Conta bbox per categoria
-        category_counts = defaultdict(int)
-        total_bboxes = 0
-        
-        for img_path in self.images_list:
-            json_path = self.annotations_dir / f"{img_path.stem}.json"
-            if json_path.exists():
-                with open(json_path, 'r') as f:
-                    metadata = json.load(f)
-                    
-                for bbox_data in metadata.get('bboxes', []):
-                    category = bbox_data['category']
-                    category_counts[category] += 1
-                    total_bboxes += 1
+        # Conta bbox per categoria (scansione completa solo la prima volta,
+        # poi aggiornata incrementalmente a ogni salvataggio)
+        if self._image_category_counts is None:
+            self._scan_category_counts()
+        category_counts = self._category_counts
+        total_bboxes = sum(category_counts.values())
                     
         print(f"\nBounding boxes totali: {total_bboxes}")
         print("\nDistribuzione per categoria:")
@@ -488,12 +852,22 @@ class JewelryBatchAnnotator:
                 if self.current_image is None:
                     break
                     
-                # Disegna interfaccia
-                display_image = self.draw_ui_overlay(self.current_image.copy())
-                cv2.imshow(window_name, display_image)
+                # Ultima posizione del mouse scartata dal throttling: ridisegnala ora
+                if self._move_pending and time.monotonic() - self._last_move >= self.MOUSEMOVE_INTERVAL:
+                    self._move_pending = False
+                    self._dirty = True
+                    
+                # Ridisegna solo se lo stato e' cambiato
+                if self._dirty:
+                    np.copyto(self._back_buffer, self.current_image)
+                    display_image = self.draw_ui_overlay(self._back_buffer)
+                    cv2.imshow(window_name, display_image)
+                    self._dirty = False
                 
-                # Handle input
-                key = cv2.waitKey(1) & 0xFF
+                # Handle input (~60 Hz quando inattivo)
+                key = cv2.waitKey(16) & 0xFF
+                if key != 0xFF:
+                    self._dirty = True
                 
                 if key == ord('q'):
                     self.save_current_annotation()
@@ -527,6 +901,8 @@ class JewelryBatchAnnotator:
             
         finally:
             self.save_current_annotation()
+            self.flush_progress_index()
+            self._prefetch_pool.shutdown(wait=False, cancel_futures=True)
             cv2.destroyAllWindows()
             self.print_statistics()
             print(f"\n💾 Annotazioni salvate in: {self.annotations_dir}")
@@ -537,10 +913,12 @@ def main():
                        help='Dataset directory (default: ~/jewelry_vision/dataset)')
     parser.add_argument('--start-idx', type=int, default=0,
                        help='Start from image index (default: 0)')
+    parser.add_argument('--full-res', action='store_true',
+                       help='Always decode images at full resolution')
     
     args = parser.parse_args()
     
-    annotator = JewelryBatchAnnotator(args.dataset_dir)
+    annotator = JewelryBatchAnnotator(args.dataset_dir, reduced_decode=not args.full_res)
     
     if args.start_idx > 0 and args.start_idx < len(annotator.images_list):
         annotator.current_image_idx = args.start_idx
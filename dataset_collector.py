@@ -16,9 +16,84 @@ import queue
 from typing import Dict, List, Tuple, Optional
 import argparse
 
+# orjson opzionale: lettura/scrittura JSON piu' veloce di metadati e statistiche
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# simplejpeg opzionale: codifica JPEG piu' veloce di cv2.imwrite
+try:
+    import simplejpeg
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    simplejpeg = None
+    SIMPLEJPEG_AVAILABLE = False
+
+# Numba opzionale: selezione compilata della detection migliore
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+def _load_json_file(path) -> Dict:
+    """Legge un file JSON in un'unica read()"""
+    data = Path(path).read_bytes()
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dump_json_bytes(obj, indent: bool = False) -> bytes:
+    """Serializza obj in bytes, pronto per una singola write()"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode('utf-8')
+
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _best_valid_detection(dets, threshold):
+        """Indice della detection con confidenza massima sopra threshold, -1 se nessuna"""
+        best = -1
+        best_conf = threshold
+        for i in range(dets.shape[0]):
+            if dets[i, 4] > best_conf:
+                best_conf = dets[i, 4]
+                best = i
+        return best
+else:
+    def _best_valid_detection(dets, threshold):
+        """Indice della detection con confidenza massima sopra threshold, -1 se nessuna"""
+        best = int(dets[:, 4].argmax())
+        return best if dets[best, 4] > threshold else -1
+
+
 class JewelryDatasetCollector:
-    def __init__(self, base_dir: str = "~/jewelry_vision/dataset"):
+    # Catture in attesa di scrittura su disco prima di iniziare a scartarle
+    IO_QUEUE_SIZE = 32
+    
+    # Buffer frame riutilizzati tra cattura e thread di scrittura
+    IO_BUFFER_POOL = 4
+    
+    # Qualita' JPEG delle catture (stesso default di cv2.imwrite)
+    JPEG_QUALITY = 95
+    
+    # Secondi minimi tra due riscritture di collection_stats.json durante la raccolta
+    STATS_FLUSH_INTERVAL = 5.0
+    
+    # Frequenza massima di ridisegno della finestra di anteprima
+    DISPLAY_FPS = 30
+    
+    def __init__(self, base_dir: str = "~/jewelry_vision/dataset", jsonl_metadata: bool = False):
         self.base_dir = Path(base_dir).expanduser()
+        # Metadati in un unico log append-only invece di un JSON per immagine.
+        # Opzionale: batch_annotator e dataset_manager leggono i JSON in annotations/temp
+        self.jsonl_metadata = jsonl_metadata
         self.setup_directories()
         
         # Categorie gioielli supportate
@@ -32,6 +107,9 @@ class JewelryDatasetCollector:
             6: "gemma",
             7: "orologio"
         }
+        # Lookup inverso e nomi ordinati per id, calcolati una volta
+        self._cat_to_id = {v: k for k, v in self.categories.items()}
+        self._category_list = [self.categories[i] for i in range(len(self.categories))]
         
         # Configurazione raccolta
         self.auto_capture = False
@@ -47,7 +125,34 @@ class JewelryDatasetCollector:
         self.annotation_mode = False
         self.selected_bbox = None
         self.temp_bbox = None
+        self._temp_bbox = [0, 0, 0, 0]  # lista riusata come temp_bbox durante il disegno
         self.drawing = False
+        self._display_buf = None  # pannello + frame, riallocato solo se cambiano le dimensioni
+        self._panel_cache = {}  # larghezza -> sfondo pannello info
+        self._info_panel_key = None  # stato mostrato nell'ultimo pannello info renderizzato
+        self._info_panel = None
+        
+        # Scrittura immagini/metadati su thread dedicato: il loop di cattura non attende il disco
+        self._io_q = queue.Queue(maxsize=self.IO_QUEUE_SIZE)
+        self._buf_pool = queue.Queue()  # buffer liberi restituiti dal worker dopo la codifica
+        self._io_high_water = 0
+        self._io_dropped = 0
+        self._last_stats_flush = 0.0  # time.monotonic() dell'ultimo save_stats dal worker
+        self._stats_dirty = False  # catture scritte ma non ancora nelle statistiche su disco
+        self._meta_fp = None  # log JSONL dei metadati, aperto dal worker alla prima cattura
+        self._last_stats_key = None  # contatori dell'ultimo collection_stats.json scritto
+        self._classes_written = False  # classes.txt gia' generato in questa sessione
+        self._io_thread = threading.Thread(target=self._io_worker, daemon=True)
+        self._io_thread.start()
+        
+        # Acquisizione camera su thread produttore: tre buffer ruotati (scritto, pubblicato, in uso)
+        self._stop = threading.Event()
+        self._frame_ready = threading.Event()
+        self._frame_lock = threading.Lock()
+        self._latest_frame = None
+        self._front_frame = None
+        self._frame_new = False
+        self._capture_running = False
         
         self.load_existing_stats()
         
@@ -67,18 +172,29 @@ class JewelryDatasetCollector:
             full_path = self.base_dir / dir_path
             full_path.mkdir(parents=True, exist_ok=True)
             
+        # Percorsi usati a ogni cattura/export, come stringhe pronte da concatenare
+        self._raw_dir = str(self.base_dir / "images/raw")
+        self._meta_dir = str(self.base_dir / "annotations/temp")
+        self._yolo_dir = str(self.base_dir / "annotations/yolo")
+        self._stats_path = str(self.base_dir / "collection_stats.json")
+        # Fuori da annotations/temp: gli altri tool trattano ogni *.json li' come annotazione
+        self._meta_log_path = str(self.base_dir / "annotations/temp.jsonl")
+            
         print(f"📁 Dataset directory: {self.base_dir}")
         
     def load_existing_stats(self):
         """Carica statistiche esistenti"""
         stats_file = self.base_dir / "collection_stats.json"
         if stats_file.exists():
-            with open(stats_file, 'r') as f:
-                data = json.load(f)
-                self.stats.update(data.get('category_counts', {}))
+            data = _load_json_file(stats_file)
+            self.stats.update(data.get('category_counts', {}))
                 
     def save_stats(self):
-        """Salva statistiche correnti"""
+        """Salva statistiche correnti, solo se i contatori sono cambiati dall'ultima scrittura"""
+        stats_key = (tuple(self.stats.items()), self.session_captures)
+        if stats_key == self._last_stats_key:
+            return
+            
         stats_data = {
             'last_updated': datetime.now().isoformat(),
             'category_counts': self.stats,
@@ -86,57 +202,138 @@ class JewelryDatasetCollector:
             'session_captures': self.session_captures
         }
         
-        with open(self.base_dir / "collection_stats.json", 'w') as f:
-            json.dump(stats_data, f, indent=2)
+        with open(self._stats_path, 'wb') as f:
+            f.write(_dump_json_bytes(stats_data, indent=True))
+        self._last_stats_key = stats_key
             
-    def generate_filename(self, category: str) -> str:
-        """Genera nome file unico"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    def generate_filename(self, category: str, now: Optional[datetime] = None) -> str:
+        """Genera nome file unico (now: istante della cattura, default adesso)"""
+        timestamp = (now or datetime.now()).strftime("%Y%m%d_%H%M%S")
         count = self.stats[category] + 1
         return f"{category}_{count:04d}_{timestamp}"
         
+    def _io_worker(self):
+        """Thread di scrittura: codifica JPEG, JSON dei metadati e statistiche"""
+        while True:
+            image, img_path, meta_path, metadata = self._io_q.get()
+            try:
+                if SIMPLEJPEG_AVAILABLE:
+                    with open(img_path, 'wb') as f:
+                        f.write(simplejpeg.encode_jpeg(
+                            image, quality=self.JPEG_QUALITY, colorspace='BGR',
+                            colorsubsampling='420', fastdct=True))
+                else:
+                    cv2.imwrite(img_path, image, [cv2.IMWRITE_JPEG_QUALITY, self.JPEG_QUALITY])
+                if meta_path is None:
+                    # Una riga per cattura nel log, bufferizzata
+                    if self._meta_fp is None:
+                        self._meta_fp = open(self._meta_log_path, 'ab', buffering=1 << 16)
+                    self._meta_fp.write(_dump_json_bytes(metadata) + b'\n')
+                else:
+                    with open(meta_path, 'wb') as f:
+                        f.write(_dump_json_bytes(metadata, indent=True))
+                # Statistiche riscritte al massimo ogni STATS_FLUSH_INTERVAL secondi
+                now = time.monotonic()
+                if now - self._last_stats_flush > self.STATS_FLUSH_INTERVAL:
+                    self.save_stats()
+                    self._last_stats_flush = now
+                    self._stats_dirty = False
+                else:
+                    self._stats_dirty = True
+            except Exception as e:
+                print(f"❌ Errore salvataggio {os.path.basename(img_path)}: {e}")
+            finally:
+                if self._buf_pool.qsize() < self.IO_BUFFER_POOL:
+                    self._buf_pool.put(image)
+                self._io_q.task_done()
+                
+    def flush_io(self):
+        """Attende che tutte le catture in coda siano scritte su disco, statistiche comprese"""
+        self._io_q.join()
+        if self._meta_fp is not None:
+            self._meta_fp.flush()
+        if self._stats_dirty:
+            self.save_stats()
+            self._stats_dirty = False
+            
+    def close_metadata_log(self):
+        """Scrive le catture in coda e chiude il log JSONL dei metadati"""
+        self.flush_io()
+        if self._meta_fp is not None:
+            self._meta_fp.close()
+            self._meta_fp = None
+        
     def save_image_with_metadata(self, image: np.ndarray, category: str, 
-                                bbox: Optional[List] = None) -> str:
-        """Salva immagine con metadati"""
-        filename = self.generate_filename(category)
+                                bbox: Optional[List] = None) -> Optional[str]:
+        """Accoda immagine e metadati per il salvataggio; None se la coda e' piena"""
+        # Un solo istante per nome file e metadati
+        now = datetime.now()
+        filename = self.generate_filename(category, now)
         
-        # Salva immagine
-        img_path = self.base_dir / "images/raw" / f"{filename}.jpg"
-        cv2.imwrite(str(img_path), image)
+        img_path = f"{self._raw_dir}/{filename}.jpg"
         
-        # Salva metadati
+        # Metadati
         metadata = {
             'filename': f"{filename}.jpg",
             'category': category,
-            'category_id': [k for k, v in self.categories.items() if v == category][0],
-            'timestamp': datetime.now().isoformat(),
-            'image_size': list(image.shape[:2]),
+            'category_id': self._cat_to_id[category],
+            'timestamp': now.isoformat(),
+            'image_size': image.shape[:2],
             'bbox': bbox if bbox else [],
             'annotation_complete': bbox is not None
         }
         
-        meta_path = self.base_dir / "annotations/temp" / f"{filename}.json"
-        with open(meta_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-            
-        # Aggiorna stats
+        meta_path = None if self.jsonl_metadata else f"{self._meta_dir}/{filename}.json"
+        
+        # Copia del frame (il buffer della camera viene riutilizzato) in un buffer del pool
+        try:
+            buf = self._buf_pool.get_nowait()
+            if buf.shape != image.shape or buf.dtype != image.dtype:
+                buf = np.empty(image.shape, image.dtype)  # risoluzione cambiata: il vecchio buffer si scarta
+        except queue.Empty:
+            buf = np.empty(image.shape, image.dtype)
+        np.copyto(buf, image)
+        
+        # Aggiorna stats prima di accodare: il prossimo nome file dipende dal conteggio,
+        # e il thread di scrittura deve gia' vederle quando salva le statistiche
         self.stats[category] += 1
         self.session_captures += 1
-        self.save_stats()
+        try:
+            self._io_q.put_nowait((buf, img_path, meta_path, metadata))
+        except queue.Full:
+            self.stats[category] -= 1
+            self.session_captures -= 1
+            if self._buf_pool.qsize() < self.IO_BUFFER_POOL:
+                self._buf_pool.put(buf)
+            self._io_dropped += 1
+            print(f"⚠️  Coda di scrittura piena: cattura {filename} scartata")
+            return None
+        self._io_high_water = max(self._io_high_water, self._io_q.qsize())
         
         return filename
         
-    def auto_capture_frame(self, frame: np.ndarray, detections: List) -> bool:
-        """Cattura automatica se rileva oggetti"""
+    def auto_capture_frame(self, frame: np.ndarray, detections) -> bool:
+        """Cattura automatica se rileva oggetti
+        
+        detections: lista di dict (x1, y1, x2, y2, confidence) oppure
+        ndarray (N, 6) [x1, y1, x2, y2, conf, cls] come prodotto da YOLO.
+        """
         if not self.auto_capture or len(detections) == 0:
             return False
             
-        # Filtra detection per confidenza
-        valid_detections = [d for d in detections if d['confidence'] > self.min_detection_confidence]
-        
-        if valid_detections:
-            category = self.categories[self.current_category]
-            
+        if isinstance(detections, np.ndarray):
+            # Batch numerico: argmax compilato sulla colonna confidenza
+            best = _best_valid_detection(np.ascontiguousarray(detections, dtype=np.float64),
+                                         self.min_detection_confidence)
+            if best < 0:
+                return False
+            bbox = [int(v) for v in detections[best, :4]]
+        else:
+            # Filtra detection per confidenza
+            valid_detections = [d for d in detections if d['confidence'] > self.min_detection_confidence]
+            if not valid_detections:
+                return False
+                
             # Prendi il bbox della detection migliore
             best_detection = max(valid_detections, key=lambda x: x['confidence'])
             bbox = [
@@ -144,13 +341,14 @@ class JewelryDatasetCollector:
                 int(best_detection['x2']), int(best_detection['y2'])
             ]
             
-            filename = self.save_image_with_metadata(frame, category, bbox)
-            print(f"🤖 Auto-captured: {filename} ({category})")
-            return True
-            
-        return False
+        category = self.categories[self.current_category]
+        filename = self.save_image_with_metadata(frame, category, bbox)
+        if filename is None:
+            return False
+        print(f"🤖 Auto-captured: {filename} ({category})")
+        return True
         
-    def manual_capture_frame(self, frame: np.ndarray) -> str:
+    def manual_capture_frame(self, frame: np.ndarray) -> Optional[str]:
         """Cattura manuale"""
         category = self.categories[self.current_category]
         bbox = None
@@ -160,7 +358,8 @@ class JewelryDatasetCollector:
             bbox = self.selected_bbox
             
         filename = self.save_image_with_metadata(frame, category, bbox)
-        print(f"📸 Manual capture: {filename} ({category})")
+        if filename is not None:
+            print(f"📸 Manual capture: {filename} ({category})")
         return filename
         
     def mouse_callback(self, event, x, y, flags, param):
@@ -168,13 +367,19 @@ class JewelryDatasetCollector:
         if not self.annotation_mode:
             return
             
-        if event == cv2.EVENT_LBUTTONDOWN:
+        # Evento piu' frequente per primo: aggiornamento in place, nient'altro
+        if event == cv2.EVENT_MOUSEMOVE:
+            if self.drawing:
+                tb = self.temp_bbox
+                tb[2] = x
+                tb[3] = y
+                
+        elif event == cv2.EVENT_LBUTTONDOWN:
             self.drawing = True
-            self.temp_bbox = [x, y, x, y]
-            
-        elif event == cv2.EVENT_MOUSEMOVE and self.drawing:
-            self.temp_bbox[2] = x
-            self.temp_bbox[3] = y
+            tb = self._temp_bbox
+            tb[0] = tb[2] = x
+            tb[1] = tb[3] = y
+            self.temp_bbox = tb
             
         elif event == cv2.EVENT_LBUTTONUP:
             self.drawing = False
@@ -185,15 +390,45 @@ class JewelryDatasetCollector:
                 self.temp_bbox = None
                 
     def draw_ui_overlay(self, frame: np.ndarray) -> np.ndarray:
-        """Disegna overlay UI"""
-        overlay = frame.copy()
+        """Disegna overlay UI in un buffer riutilizzato (valido fino alla chiamata successiva)"""
         h, w = frame.shape[:2]
         
-        # Pannello informazioni
-        info_panel = np.zeros((120, w, 3), dtype=np.uint8)
+        # Buffer display: pannello in alto, frame copiato sotto senza vstack
+        if self._display_buf is None or self._display_buf.shape != (h + 120, w, 3):
+            self._display_buf = np.empty((h + 120, w, 3), dtype=np.uint8)
+        combined = self._display_buf
+        np.copyto(combined[120:], frame)
         
-        # Categoria corrente
+        # Pannello informazioni, ridisegnato solo quando cambia lo stato mostrato
+        np.copyto(combined[:120], self._get_info_panel(w))
         category = self.categories[self.current_category]
+        
+        # Disegna bbox selezionato
+        if self.selected_bbox:
+            x1, y1, x2, y2 = self.selected_bbox
+            cv2.rectangle(combined, (x1, y1+120), (x2, y2+120), (0, 255, 0), 2)
+            cv2.putText(combined, category, (x1, y1+115), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        
+        # Disegna bbox temporaneo
+        if self.temp_bbox and self.drawing:
+            x1, y1, x2, y2 = self.temp_bbox
+            cv2.rectangle(combined, (x1, y1+120), (x2, y2+120), (255, 255, 0), 2)
+            
+        return combined
+        
+    def _get_info_panel(self, w: int) -> np.ndarray:
+        """Pannello info completo, rigenerato solo se categoria, modi o contatori cambiano"""
+        category = self.categories[self.current_category]
+        key = (w, self.current_category, self.auto_capture, self.annotation_mode,
+               self.session_captures, self.stats[category])
+        if key == self._info_panel_key:
+            return self._info_panel
+            
+        # Sfondo con la riga comandi gia' disegnata
+        info_panel = self._get_static_panel(w).copy()
+        
+        # Categoria corrente
         cv2.putText(info_panel, f"Categoria: {category.upper()}", (10, 25), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
         
@@ -217,27 +452,63 @@ class JewelryDatasetCollector:
         cv2.putText(info_panel, f"{category}: {current_count}", (300, 50), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         
+        self._info_panel_key = key
+        self._info_panel = info_panel
+        return info_panel
+        
+    def _get_static_panel(self, w: int) -> np.ndarray:
+        """Sfondo del pannello con la riga comandi, costruito una volta per larghezza"""
+        panel = self._panel_cache.get(w)
+        if panel is not None:
+            return panel
+            
+        panel = np.zeros((120, w, 3), dtype=np.uint8)
+        
         # Comandi
-        cv2.putText(info_panel, "SPACE=Cattura | A=Auto | B=Annotation | 1-8=Categoria | Q=Quit", 
+        cv2.putText(panel, "SPACE=Cattura | A=Auto | B=Annotation | 1-8=Categoria | Q=Quit", 
                    (10, 100), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (200, 200, 200), 1)
         
-        # Combina frame e pannello
-        combined = np.vstack([info_panel, overlay])
+        self._panel_cache[w] = panel
+        return panel
         
-        # Disegna bbox selezionato
-        if self.selected_bbox:
-            x1, y1, x2, y2 = self.selected_bbox
-            cv2.rectangle(combined, (x1, y1+120), (x2, y2+120), (0, 255, 0), 2)
-            cv2.putText(combined, category, (x1, y1+115), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        # Disegna bbox temporaneo
-        if self.temp_bbox and self.drawing:
-            x1, y1, x2, y2 = self.temp_bbox
-            cv2.rectangle(combined, (x1, y1+120), (x2, y2+120), (255, 255, 0), 2)
+    def _capture_loop(self, cap: cv2.VideoCapture):
+        """Thread produttore: grab/retrieve continui, pubblica solo il frame piu' recente"""
+        back = None
+        try:
+            while not self._stop.is_set():
+                if not cap.grab():
+                    break
+                ret, frame = cap.retrieve(back) if back is not None else cap.retrieve()
+                if not ret:
+                    break
+                with self._frame_lock:
+                    # Il frame non ancora consumato viene sovrascritto: nessun accumulo
+                    back, self._latest_frame = self._latest_frame, frame
+                    self._frame_new = True
+                self._frame_ready.set()
+        finally:
+            with self._frame_lock:
+                self._capture_running = False
+            self._frame_ready.set()
             
-        return combined
-        
+    def _take_latest_frame(self) -> Optional[np.ndarray]:
+        """Attende e restituisce il frame piu' recente; None se l'acquisizione e' terminata
+        
+        Il frame resta valido fino alla chiamata successiva.
+        """
+        while True:
+            self._frame_ready.wait()
+            with self._frame_lock:
+                # A produttore fermo l'evento resta impostato: ogni chiamata successiva ritorna subito
+                if self._capture_running:
+                    self._frame_ready.clear()
+                if self._frame_new:
+                    self._front_frame, self._latest_frame = self._latest_frame, self._front_frame
+                    self._frame_new = False
+                    return self._front_frame
+                if not self._capture_running:
+                    return None
+                    
     def print_stats_summary(self):
         """Stampa riassunto statistiche"""
         print("\n" + "="*50)
@@ -260,45 +531,63 @@ class JewelryDatasetCollector:
         """Esporta annotazioni in formato YOLO"""
         print("\n🔄 Exporting YOLO annotations...")
         
-        temp_dir = self.base_dir / "annotations/temp"
-        yolo_dir = self.base_dir / "annotations/yolo"
+        yolo_dir = self._yolo_dir
         
-        exported = 0
+        # Include le catture ancora in coda
+        self.flush_io()
         
-        for json_file in temp_dir.glob("*.json"):
-            with open(json_file, 'r') as f:
-                metadata = json.load(f)
-                
+        # Metadati per stem: log JSONL (lettura sequenziale), poi i JSON per immagine
+        records = {}
+        if os.path.exists(self._meta_log_path):
+            with open(self._meta_log_path, 'rb') as f:
+                for line in f:
+                    if line.strip():
+                        metadata = orjson.loads(line) if ORJSON_AVAILABLE else json.loads(line)
+                        records[os.path.splitext(metadata['filename'])[0]] = metadata
+                        
+        # scandir: nessuno stat per file; come Path.glob("*.json") include anche i file nascosti
+        with os.scandir(self._meta_dir) as it:
+            json_entries = [e for e in it if e.name.endswith('.json')]
+        for entry in json_entries:
+            records[entry.name[:-5]] = _load_json_file(entry.path)
+            
+        # Raccoglie bbox e dimensioni di tutte le annotazioni complete
+        stems, class_ids, bboxes, sizes = [], [], [], []
+        for stem, metadata in records.items():
             if not metadata.get('annotation_complete') or not metadata.get('bbox'):
                 continue
                 
-            # Converti bbox in formato YOLO
-            img_h, img_w = metadata['image_size']
-            x1, y1, x2, y2 = metadata['bbox']
+            stems.append(stem)
+            class_ids.append(metadata['category_id'])
+            bboxes.append(metadata['bbox'])
+            sizes.append(metadata['image_size'])
             
-            # Normalizza coordinate
-            center_x = (x1 + x2) / 2.0 / img_w
-            center_y = (y1 + y2) / 2.0 / img_h
-            width = (x2 - x1) / img_w
-            height = (y2 - y1) / img_h
+        exported = len(stems)
+        if exported:
+            # Converti in formato YOLO (normalizzato), tutte le bbox insieme
+            boxes = np.asarray(bboxes, dtype=np.float64)
+            img_h, img_w = np.asarray(sizes, dtype=np.float64).T
             
-            # Salva annotazione YOLO
-            yolo_file = yolo_dir / f"{json_file.stem}.txt"
-            with open(yolo_file, 'w') as f:
-                class_id = metadata['category_id']
-                f.write(f"{class_id} {center_x:.6f} {center_y:.6f} {width:.6f} {height:.6f}\n")
-                
-            exported += 1
+            center_x = (boxes[:, 0] + boxes[:, 2]) / 2.0 / img_w
+            center_y = (boxes[:, 1] + boxes[:, 3]) / 2.0 / img_h
+            width = (boxes[:, 2] - boxes[:, 0]) / img_w
+            height = (boxes[:, 3] - boxes[:, 1]) / img_h
+            
+            # Salva annotazioni YOLO (una sola write per file)
+            rows = zip(stems, class_ids, center_x.tolist(), center_y.tolist(), width.tolist(), height.tolist())
+            for stem, class_id, cx, cy, bw, bh in rows:
+                with open(f"{yolo_dir}/{stem}.txt", 'w') as f:
+                    f.write(f"{class_id} {cx:.6f} {cy:.6f} {bw:.6f} {bh:.6f}\n")
             
         print(f"✅ Exported {exported} YOLO annotations")
         
-        # Genera classes.txt
-        classes_file = yolo_dir / "classes.txt"
-        with open(classes_file, 'w') as f:
-            for i in range(len(self.categories)):
-                f.write(f"{self.categories[i]}\n")
-                
-        print(f"📝 Generated {classes_file}")
+        # Genera classes.txt (le categorie non cambiano: una volta per sessione)
+        classes_file = f"{yolo_dir}/classes.txt"
+        if not self._classes_written or not os.path.exists(classes_file):
+            with open(classes_file, 'w') as f:
+                f.write(''.join(f"{name}\n" for name in self._category_list))
+            self._classes_written = True
+            print(f"📝 Generated {classes_file}")
         
     def run_collection_interface(self, camera_id: int = 0):
         """Avvia interfaccia di raccolta"""
@@ -318,8 +607,16 @@ class JewelryDatasetCollector:
             print(f"❌ Cannot open camera {camera_id}")
             return
             
+        # Lavori per frame minuscoli: il pool OpenCV contenderebbe solo con i thread camera/I/O
+        prev_num_threads = cv2.getNumThreads()
+        cv2.setNumThreads(1)
+            
+        # MJPG prima della risoluzione: la camera comprime in hardware, niente YUYV->BGR su CPU
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
         cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
         cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        # Buffer driver minimo: il thread produttore vuole sempre il frame piu' recente
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
         
         window_name = "Jewelry Dataset Collector"
         cv2.namedWindow(window_name)
@@ -327,10 +624,17 @@ class JewelryDatasetCollector:
         
         last_auto_capture = time.time()
         
+        self._stop.clear()
+        self._capture_running = True
+        capture_thread = threading.Thread(target=self._capture_loop, args=(cap,), daemon=True)
+        capture_thread.start()
+        
         try:
+            frame_ms = 1000.0 / self.DISPLAY_FPS
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                loop_start = time.perf_counter()
+                frame = self._take_latest_frame()
+                if frame is None:
                     break
                     
                 # Auto capture check
@@ -345,8 +649,9 @@ class JewelryDatasetCollector:
                 display_frame = self.draw_ui_overlay(frame)
                 cv2.imshow(window_name, display_frame)
                 
-                # Handle input
-                key = cv2.waitKey(1) & 0xFF
+                # Handle input, dormendo il resto del periodo di frame invece di fare polling
+                elapsed_ms = (time.perf_counter() - loop_start) * 1000.0
+                key = cv2.waitKey(max(1, int(frame_ms - elapsed_ms))) & 0xFF
                 
                 if key == ord('q'):
                     break
@@ -376,8 +681,22 @@ class JewelryDatasetCollector:
             print("\n⏹️  Collection stopped by user")
             
         finally:
-            cap.release()
+            self._stop.set()
+            capture_thread.join(timeout=2.0)
+            
+            # Scrive le catture ancora in coda prima di chiudere
+            self.close_metadata_log()
+            if self._io_dropped:
+                print(f"⚠️  Catture scartate (coda piena): {self._io_dropped}, "
+                      f"picco coda {self._io_high_water}/{self.IO_QUEUE_SIZE}")
+            if capture_thread.is_alive():
+                # grab() ancora bloccato: rilasciare la camera sotto al thread non e' sicuro,
+                # il thread daemon termina con il processo
+                print("⚠️  Thread di acquisizione ancora attivo: camera non rilasciata")
+            else:
+                cap.release()
             cv2.destroyAllWindows()
+            cv2.setNumThreads(prev_num_threads)
             self.print_stats_summary()
             print(f"\n💾 Data saved to: {self.base_dir}")
 
@@ -386,10 +705,12 @@ def main():
     parser.add_argument('--camera', type=int, default=0, help='Camera ID (default: 0)')
     parser.add_argument('--dataset-dir', type=str, default='~/jewelry_vision/dataset', 
                        help='Dataset directory (default: ~/jewelry_vision/dataset)')
+    parser.add_argument('--jsonl-metadata', action='store_true',
+                       help='Append capture metadata to annotations/temp.jsonl instead of one JSON per image')
     
     args = parser.parse_args()
     
-    collector = JewelryDatasetCollector(args.dataset_dir)
+    collector = JewelryDatasetCollector(args.dataset_dir, jsonl_metadata=args.jsonl_metadata)
     collector.run_collection_interface(args.camera)
 
 if __name__ == "__main__":
@@ -4,18 +4,277 @@ Jewelry Dataset Manager
 Sistema di gestione, validazione e preparazione dataset per training
 """
 
-import cv2
 import os
+import io
 import json
+import mmap
 import shutil
 import random
+import tarfile
+import time
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 from collections import defaultdict, Counter
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import argparse
+import importlib.util
+import threading
 from datetime import datetime
 
+# orjson opzionale: parsing delle annotazioni piu' veloce
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# pysimdjson opzionale: parser riutilizzato per il parsing in blocco delle annotazioni
+try:
+    import simdjson
+    SIMDJSON_AVAILABLE = True
+except ImportError:
+    simdjson = None
+    SIMDJSON_AVAILABLE = False
+
+# Pillow opzionale: dimensioni immagine dall'header, senza decodificare i pixel
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    PIL_AVAILABLE = False
+
+# Numba opzionale: verifica compilata delle coordinate bbox. Solo la presenza
+# viene controllata qui: l'import (centinaia di ms) avviene alla prima verifica
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+# Un simdjson.Parser non e' thread-safe: ne teniamo uno per thread
+_simd_local = threading.local()
+
+# Da quante annotazioni da leggere in su conviene il parsing in blocco
+_BULK_PARSE_MIN_FILES = 16
+
+# Worker massimi per la lettura parallela delle annotazioni
+_MAX_LOAD_WORKERS = 8
+
+# Sotto questa dimensione il costo di setup di mmap supera la copia del read()
+_MMAP_MIN_SIZE = 4096
+
+# Riga label YOLO: ripetuta n volte, formatta un file intero con un'unica operazione %
+_YOLO_LINE_FORMAT = "%s %.6f %.6f %.6f %.6f\n"
+
+# Estensioni immagine riconosciute, nell'ordine di scansione
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# Modi di export delle immagini: copia, hardlink o symlink verso images/raw
+EXPORT_LINK_MODES = ('copy', 'hardlink', 'symlink')
+
+
+def _get_simd_parser():
+    """Restituisce il simdjson.Parser del thread corrente"""
+    parser = getattr(_simd_local, 'parser', None)
+    if parser is None:
+        parser = _simd_local.parser = simdjson.Parser()
+    return parser
+
+
+def _bulk_parse_json_files(paths: List[Path]) -> Optional[List]:
+    """
+    Parsa tutti i file come un unico array JSON, ammortizzando il setup del
+    parser. None se un file non e' leggibile o non e' un documento valido:
+    il chiamante ricade sul parsing per file che registra l'errore puntuale
+    """
+    try:
+        data = b'[' + b','.join(p.read_bytes() for p in paths) + b']'
+        if SIMDJSON_AVAILABLE:
+            # recursive=True restituisce oggetti Python nativi: i proxy di simdjson
+            # sono validi solo fino al parse successivo
+            docs = _get_simd_parser().parse(data, True)
+        elif ORJSON_AVAILABLE:
+            docs = orjson.loads(data)
+        else:
+            docs = json.loads(data)
+    except Exception:
+        return None
+    
+    if not isinstance(docs, list) or len(docs) != len(paths):
+        return None
+    return docs
+
+
+def _parse_json_bytes(data) -> Dict:
+    """Decodifica bytes o memoryview con orjson se disponibile"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+def _load_json_file(path) -> Dict:
+    """Legge un file JSON in un'unica read(), mappandolo in memoria se abbastanza grande"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:
+            return _parse_json_bytes(f.read())
+        
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # La view va rilasciata prima della chiusura della mappa
+            with memoryview(mm) as view:
+                return _parse_json_bytes(view)
+
+
+def _try_load_json_file(path) -> Optional[Dict]:
+    """Come _load_json_file, ma None se il file non e' leggibile o non valido"""
+    try:
+        return _load_json_file(path)
+    except Exception:
+        return None
+
+
+def _copy_file(src: Path, dst: Path):
+    """
+    Come shutil.copy2, ma i dati passano da os.copy_file_range: copia interna al
+    kernel, reflink sui filesystem che lo supportano. Ricade su copy2 se non disponibile
+    """
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _link_or_copy(src: Path, dst: Path, link_mode: str = 'copy'):
+    """Porta src in dst con hardlink/symlink (nessun byte copiato), copiando se il link fallisce"""
+    if link_mode in ('hardlink', 'symlink'):
+        link = os.link if link_mode == 'hardlink' else os.symlink
+        target = src if link_mode == 'hardlink' else src.resolve()
+        try:
+            try:
+                link(target, dst)
+            except FileExistsError:
+                dst.unlink()
+                link(target, dst)
+            return
+        except OSError:
+            pass
+    _copy_file(src, dst)
+
+
+def _get_image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """(h, w) letti dall'header: Image.open e' lazy, i pixel non vengono decodificati"""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(path) as im:
+            w, h = im.size
+    except Exception:
+        return None
+    return h, w
+
+
+def _size_summary(sizes: List[Tuple]) -> Tuple[Tuple, Tuple]:
+    """(min, max, media) di altezze e larghezze, con riduzioni NumPy quando le dimensioni sono intere"""
+    try:
+        arr = np.asarray(sizes)
+    except ValueError:
+        arr = None  # dimensioni di lunghezza diversa
+    if arr is not None and arr.ndim == 2 and arr.shape[1] >= 2 and arr.dtype.kind in 'iu':
+        # Somma intera esatta: stessa media della somma Python
+        return tuple(
+            (int(col.min()), int(col.max()), int(col.sum()) / len(col))
+            for col in (arr[:, 0], arr[:, 1])
+        )
+    
+    heights = [s[0] for s in sizes]
+    widths = [s[1] for s in sizes]
+    return ((min(heights), max(heights), sum(heights) / len(heights)),
+            (min(widths), max(widths), sum(widths) / len(widths)))
+
+
+def _iter_files(root: str, rel: str = ''):
+    """(path, percorso relativo) dei file sotto root, usando il tipo gia' fornito da scandir"""
+    with os.scandir(root) as it:
+        entries = list(it)
+    for entry in entries:
+        rel_path = f"{rel}{entry.name}"
+        if entry.is_dir(follow_symlinks=False):
+            yield from _iter_files(entry.path, f"{rel_path}/")
+        elif entry.is_file():
+            yield entry.path, rel_path
+
+
+def _is_number(value) -> bool:
+    return type(value) in (int, float)
+
+
+def _invalid_bbox_mask_numpy(boxes):
+    """True per le bbox (N,4) con x1 >= x2 o y1 >= y2"""
+    return (boxes[:, 0] >= boxes[:, 2]) | (boxes[:, 1] >= boxes[:, 3])
+
+
+def _build_bbox_kernel():
+    """Compila la verifica bbox con Numba, se importabile; altrimenti la versione NumPy"""
+    try:
+        from numba import njit
+    except ImportError:
+        return _invalid_bbox_mask_numpy
+    
+    @njit(cache=True)
+    def _invalid_bbox_mask_numba(boxes):
+        """True per le bbox (N,4) con x1 >= x2 o y1 >= y2"""
+        bad = np.zeros(boxes.shape[0], np.bool_)
+        for i in range(boxes.shape[0]):
+            bad[i] = boxes[i, 0] >= boxes[i, 2] or boxes[i, 1] >= boxes[i, 3]
+        return bad
+    return _invalid_bbox_mask_numba
+
+
+_bbox_kernel = None
+
+
+def _invalid_bbox_mask(boxes):
+    """True per le bbox (N,4) con x1 >= x2 o y1 >= y2"""
+    global _bbox_kernel
+    if _bbox_kernel is None:
+        _bbox_kernel = _build_bbox_kernel() if NUMBA_AVAILABLE else _invalid_bbox_mask_numpy
+    return _bbox_kernel(boxes)
+
+
+def _yolo_box_lists(metadata: Dict) -> Optional[Tuple[List, List]]:
+    """
+    Categorie e bbox da convertire in YOLO. None se un valore non e' numerico o
+    non ha 4 coordinate: quei file passano dalla conversione scalare, che
+    riproduce esattamente scrittura parziale e messaggio d'errore
+    """
+    bboxes = metadata.get('bboxes', [])
+    if not bboxes and metadata.get('bbox'):
+        bboxes = [{'bbox': metadata['bbox'], 
+                 'category_id': metadata.get('category_id', 0)}]
+    if not isinstance(bboxes, list):
+        return None
+    
+    cats, boxes = [], []
+    for bbox_data in bboxes:
+        if not isinstance(bbox_data, dict) or 'bbox' not in bbox_data:
+            continue
+        bbox = bbox_data['bbox']
+        if not isinstance(bbox, list) or len(bbox) != 4 or not all(map(_is_number, bbox)):
+            return None
+        cats.append(bbox_data.get('category_id', 0))
+        boxes.append(bbox)
+    return cats, boxes
+
+
 class JewelryDatasetManager:
     def __init__(self, dataset_dir: str = "~/jewelry_vision/dataset"):
         self.dataset_dir = Path(dataset_dir).expanduser()
@@ -33,10 +292,107 @@ class JewelryDatasetManager:
             4: "pendente", 5: "spilla", 6: "gemma", 7: "orologio"
         }
         
+        # Nomi categoria indicizzati per id, con 'unknown' in coda per gli id sconosciuti
+        self._cat_names = [self.categories[i] for i in range(len(self.categories))] + ['unknown']
+        self._cat_code = {cat_id: cat_id for cat_id in range(len(self.categories))}
+        
         # Statistiche dataset
         self.dataset_stats = {}
         self.validation_errors = []
         
+        # Cache annotazioni già lette: path -> (mtime_ns, metadata)
+        self._ann_cache: Dict[Path, Tuple[int, Dict]] = {}
+        
+        # Cache listing directory: dir -> (mtime_ns, file entries)
+        self._dir_cache: Dict[Path, Tuple[int, List[os.DirEntry]]] = {}
+        self._stem_index: Tuple[Optional[List], Dict[str, Path]] = (None, {})
+        
+    def _list_files(self, directory: Path) -> List[os.DirEntry]:
+        """File contenuti in directory, da un unico scandir riusato finche' la directory non cambia"""
+        try:
+            mtime_ns = directory.stat().st_mtime_ns
+        except OSError:
+            return []
+        
+        cached = self._dir_cache.get(directory)
+        if cached and cached[0] == mtime_ns:
+            return cached[1]
+        
+        with os.scandir(directory) as it:
+            entries = [e for e in it if e.is_file()]
+        self._dir_cache[directory] = (mtime_ns, entries)
+        return entries
+    
+    def _image_files(self) -> List[Path]:
+        """Immagini raw, raggruppate per estensione come i glob originali"""
+        entries = self._list_files(self.raw_images_dir)
+        return [Path(e.path) for ext in IMAGE_EXTENSIONS
+                for e in entries if e.name.endswith(ext)]
+    
+    def _image_index(self) -> Dict[str, Path]:
+        """stem -> immagine raw; a parità di stem vince l'estensione che viene prima"""
+        entries = self._list_files(self.raw_images_dir)
+        if self._stem_index[0] is not entries:
+            index = {}
+            for img in self._image_files():
+                index.setdefault(img.stem, img)
+            self._stem_index = (entries, index)
+        return self._stem_index[1]
+    
+    def _annotation_image_size(self, json_path: Path, metadata: Dict):
+        """image_size dell'annotazione; se manca, letto dall'header dell'immagine raw"""
+        if isinstance(metadata, dict) and 'image_size' not in metadata:
+            img_file = self._image_index().get(json_path.stem)
+            size = _get_image_size(img_file) if img_file else None
+            if size:
+                return size
+        return metadata['image_size']
+    
+    def _annotation_files(self) -> List[Path]:
+        """Annotazioni JSON in annotations/temp"""
+        return [Path(e.path) for e in self._list_files(self.annotations_temp_dir)
+                if e.name.endswith('.json')]
+    
+    def _load_annotation(self, path: Path) -> Dict:
+        """Carica un'annotazione JSON riusando la cache se il file non è cambiato"""
+        st = path.stat()
+        cached = self._ann_cache.get(path)
+        if cached and cached[0] == st.st_mtime_ns:
+            return cached[1]
+        
+        metadata = _load_json_file(path)
+        self._ann_cache[path] = (st.st_mtime_ns, metadata)
+        return metadata
+    
+    def _prefetch_annotations(self, paths: List[Path]):
+        """Popola la cache con un unico parse in blocco delle annotazioni non ancora lette"""
+        pending = []
+        for path in paths:
+            try:
+                mtime_ns = path.stat().st_mtime_ns
+            except OSError:
+                continue
+            cached = self._ann_cache.get(path)
+            if not cached or cached[0] != mtime_ns:
+                pending.append((path, mtime_ns))
+        
+        if len(pending) < 2:
+            return
+        
+        docs = None
+        if len(pending) >= _BULK_PARSE_MIN_FILES:
+            docs = _bulk_parse_json_files([path for path, _ in pending])
+        
+        if docs is None:
+            # Lettura per file sovrapposta sui thread; gli errori restano al
+            # parsing puntuale del chiamante, che li registra
+            with ThreadPoolExecutor(max_workers=min(_MAX_LOAD_WORKERS, len(pending))) as ex:
+                docs = list(ex.map(_try_load_json_file, [path for path, _ in pending]))
+        
+        for (path, mtime_ns), metadata in zip(pending, docs):
+            if metadata is not None:
+                self._ann_cache[path] = (mtime_ns, metadata)
+    
     def scan_dataset(self) -> Dict:
         """Scansiona e analizza il dataset completo"""
         print("🔍 Scanning dataset...")
@@ -48,6 +404,7 @@ class JewelryDatasetManager:
             'category_distribution': defaultdict(int),
             'image_sizes': [],
             'annotation_quality': {'valid': 0, 'invalid': 0},
+            'per_file': {},
             'files': {
                 'raw_images': [],
                 'annotations': [],
@@ -57,21 +414,20 @@ class JewelryDatasetManager:
         }
         
         # Scansiona immagini raw
-        if self.raw_images_dir.exists():
-            for ext in ['*.jpg', '*.jpeg', '*.png']:
-                stats['files']['raw_images'].extend(self.raw_images_dir.glob(ext))
+        stats['files']['raw_images'] = self._image_files()
         
         stats['total_images'] = len(stats['files']['raw_images'])
         
         # Scansiona annotazioni
-        if self.annotations_temp_dir.exists():
-            stats['files']['annotations'] = list(self.annotations_temp_dir.glob('*.json'))
+        stats['files']['annotations'] = self._annotation_files()
         
         # Analizza annotazioni
+        self._prefetch_annotations(stats['files']['annotations'])
+        n_known = len(self.categories)
+        cat_codes = []  # indice in _cat_names per ogni bbox, contato alla fine con bincount
         for ann_file in stats['files']['annotations']:
             try:
-                with open(ann_file, 'r') as f:
-                    metadata = json.load(f)
+                metadata = self._load_annotation(ann_file)
                 
                 # Verifica se ha annotazioni valide
                 bboxes = metadata.get('bboxes', [])
@@ -80,6 +436,20 @@ class JewelryDatasetManager:
                     bboxes = [{'bbox': metadata['bbox'], 
                              'category_id': metadata.get('category_id', 0)}]
                 
+                # Categoria principale per lo split, con le stesse regole di create_train_val_split
+                if bboxes:
+                    try:
+                        if len(bboxes) == 1:
+                            # Caso tipico (una cattura, un oggetto): nessun conteggio da fare
+                            main_category = bboxes[0].get('category_id', 0)
+                            hash(main_category)  # come Counter: id non hashable escludono il file
+                        else:
+                            categories = [bbox.get('category_id', 0) for bbox in bboxes]
+                            main_category = Counter(categories).most_common(1)[0][0]
+                        stats['per_file'][ann_file.stem] = {'main_category': main_category}
+                    except Exception:
+                        pass
+                
                 if bboxes:
                     stats['annotated_images'] += 1
                     stats['total_bboxes'] += len(bboxes)
@@ -88,8 +458,10 @@ class JewelryDatasetManager:
                     for bbox_data in bboxes:
                         if isinstance(bbox_data, dict):
                             cat_id = bbox_data.get('category_id', 0)
-                            category = self.categories.get(cat_id, 'unknown')
-                            stats['category_distribution'][category] += 1
+                            if type(cat_id) is int and 0 <= cat_id < n_known:
+                                cat_codes.append(cat_id)
+                            else:
+                                cat_codes.append(self._cat_code.get(cat_id, n_known))
                 
                 # Dimensioni immagini
                 img_size = metadata.get('image_size')
@@ -102,9 +474,17 @@ class JewelryDatasetManager:
                 stats['annotation_quality']['invalid'] += 1
                 self.validation_errors.append(f"Invalid annotation {ann_file}: {e}")
         
+        # Distribuzione categorie in ordine di prima apparizione, come il conteggio per bbox
+        if cat_codes:
+            codes = np.fromiter(cat_codes, dtype=np.int64, count=len(cat_codes))
+            counts = np.bincount(codes, minlength=n_known + 1)
+            present, first_seen = np.unique(codes, return_index=True)
+            for code in present[np.argsort(first_seen)].tolist():
+                stats['category_distribution'][self._cat_names[code]] = int(counts[code])
+        
         # Trova file orfani
         annotated_stems = {f.stem for f in stats['files']['annotations']}
-        image_stems = {f.stem for f in stats['files']['raw_images']}
+        image_stems = self._image_index().keys()
         
         stats['files']['orphaned_images'] = [
             img for img in stats['files']['raw_images'] 
@@ -146,56 +526,111 @@ class JewelryDatasetManager:
             if orphaned_annotations > 0:
                 errors.append(f"{orphaned_annotations} annotations without images")
         
-        # Verifica validità annotazioni
-        for ann_file in self.annotations_temp_dir.glob('*.json'):
-            try:
-                with open(ann_file, 'r') as f:
-                    metadata = json.load(f)
-                
-                # Verifica campi richiesti
-                required_fields = ['filename', 'image_size']
-                for field in required_fields:
-                    if field not in metadata:
-                        errors.append(f"Missing field '{field}' in {ann_file}")
-                
-                # Verifica bbox
-                bboxes = metadata.get('bboxes', [])
-                if metadata.get('bbox') and not bboxes:
-                    bboxes = [{'bbox': metadata['bbox']}]
-                
-                for i, bbox_data in enumerate(bboxes):
-                    if isinstance(bbox_data, dict) and 'bbox' in bbox_data:
-                        bbox = bbox_data['bbox']
-                        if len(bbox) != 4:
-                            errors.append(f"Invalid bbox format in {ann_file} (bbox {i})")
-                        
-                        # Verifica coordinate
-                        x1, y1, x2, y2 = bbox
-                        if x1 >= x2 or y1 >= y2:
-                            errors.append(f"Invalid bbox coordinates in {ann_file} (bbox {i})")
-                
-            except json.JSONDecodeError:
-                errors.append(f"Invalid JSON in {ann_file}")
-            except Exception as e:
-                errors.append(f"Error validating {ann_file}: {e}")
+        # Verifica validità annotazioni: le bbox regolari di tutti i file vengono
+        # controllate insieme, le altre passano dalla verifica per file
+        results = []  # messaggi d'errore, o (file, indice bbox, riga in boxes)
+        boxes = []
+        for ann_file in self._annotation_files():
+            start = len(boxes)
+            checks = self._collect_bbox_checks(ann_file, boxes)
+            if checks is None:
+                del boxes[start:]
+                results.extend(self._validate_annotation(ann_file))
+            else:
+                results.extend(checks)
+        
+        bad = _invalid_bbox_mask(np.asarray(boxes, dtype=np.float64).reshape(-1, 4))
+        for item in results:
+            if isinstance(item, str):
+                errors.append(item)
+            elif bad[item[2]]:
+                errors.append(f"Invalid bbox coordinates in {item[0]} (bbox {item[1]})")
         
         self.validation_errors.extend(errors)
         return errors
     
+    def _collect_bbox_checks(self, ann_file: Path, boxes: List) -> Optional[List]:
+        """
+        Errori sui campi richiesti e bbox da verificare (aggiunte a boxes) di un file.
+        None se il file non e' leggibile o ha bbox irregolari: i messaggi vengono
+        allora da _validate_annotation, come nella verifica bbox per bbox
+        """
+        try:
+            metadata = self._load_annotation(ann_file)
+        except Exception:
+            return None
+        if not isinstance(metadata, dict):
+            return None
+        
+        checks = [f"Missing field '{field}' in {ann_file}"
+                  for field in ('filename', 'image_size') if field not in metadata]
+        
+        bboxes = metadata.get('bboxes', [])
+        if metadata.get('bbox') and not bboxes:
+            bboxes = [{'bbox': metadata['bbox']}]
+        if not isinstance(bboxes, list):
+            return None
+        
+        for i, bbox_data in enumerate(bboxes):
+            if isinstance(bbox_data, dict) and 'bbox' in bbox_data:
+                bbox = bbox_data['bbox']
+                if not isinstance(bbox, list) or len(bbox) != 4 or not all(map(_is_number, bbox)):
+                    return None
+                checks.append((ann_file, i, len(boxes)))
+                boxes.append(bbox)
+        return checks
+    
+    def _validate_annotation(self, ann_file: Path) -> List[str]:
+        """Verifica bbox per bbox di una singola annotazione"""
+        errors = []
+        try:
+            metadata = self._load_annotation(ann_file)
+            
+            # Verifica campi richiesti
+            required_fields = ['filename', 'image_size']
+            for field in required_fields:
+                if field not in metadata:
+                    errors.append(f"Missing field '{field}' in {ann_file}")
+            
+            # Verifica bbox
+            bboxes = metadata.get('bboxes', [])
+            if metadata.get('bbox') and not bboxes:
+                bboxes = [{'bbox': metadata['bbox']}]
+            
+            for i, bbox_data in enumerate(bboxes):
+                if isinstance(bbox_data, dict) and 'bbox' in bbox_data:
+                    bbox = bbox_data['bbox']
+                    if len(bbox) != 4:
+                        errors.append(f"Invalid bbox format in {ann_file} (bbox {i})")
+                    
+                    # Verifica coordinate
+                    x1, y1, x2, y2 = bbox
+                    if x1 >= x2 or y1 >= y2:
+                        errors.append(f"Invalid bbox coordinates in {ann_file} (bbox {i})")
+            
+        except json.JSONDecodeError:
+            errors.append(f"Invalid JSON in {ann_file}")
+        except Exception as e:
+            errors.append(f"Error validating {ann_file}: {e}")
+        
+        return errors
+    
     def clean_dataset(self, remove_orphans: bool = False):
         """Pulisce il dataset rimuovendo file corrotti o duplicati"""
         print("🧹 Cleaning dataset...")
         
         cleaned_count = 0
+        removed = set()
         
         # Rimuovi annotazioni corrotte
-        for ann_file in self.annotations_temp_dir.glob('*.json'):
+        for ann_file in self._annotation_files():
             try:
-                with open(ann_file, 'r') as f:
-                    json.load(f)
+                self._load_annotation(ann_file)
             except:
                 print(f"🗑️  Removing corrupted annotation: {ann_file}")
                 ann_file.unlink()
+                self._ann_cache.pop(ann_file, None)
+                removed.add(ann_file)
                 cleaned_count += 1
         
         # Rimuovi file orfani se richiesto
@@ -207,11 +642,16 @@ class JewelryDatasetManager:
                     cleaned_count += 1
                 
                 for orphan_ann in self.dataset_stats['files']['orphaned_annotations']:
+                    # Un'annotazione corrotta puo' essere anche orfana: gia' rimossa sopra
+                    if orphan_ann in removed:
+                        continue
                     print(f"🗑️  Removing orphaned annotation: {orphan_ann}")
                     orphan_ann.unlink()
+                    self._ann_cache.pop(orphan_ann, None)
                     cleaned_count += 1
         
         print(f"✅ Cleaned {cleaned_count} files")
+        self._dir_cache.clear()
         
         # Re-scan dopo pulizia
         self.scan_dataset()
@@ -224,60 +664,49 @@ class JewelryDatasetManager:
         if not self.dataset_stats:
             self.scan_dataset()
         
-        annotated_files = []
-        
-        # Raccogli file annotati con le loro categorie
-        for ann_file in self.annotations_temp_dir.glob('*.json'):
-            try:
-                with open(ann_file, 'r') as f:
-                    metadata = json.load(f)
-                
-                bboxes = metadata.get('bboxes', [])
-                if not bboxes and metadata.get('bbox'):
-                    bboxes = [{'bbox': metadata['bbox'], 
-                             'category_id': metadata.get('category_id', 0)}]
-                
-                if bboxes:
-                    # Prendi la categoria più frequente per questo file
-                    categories = [bbox.get('category_id', 0) for bbox in bboxes]
-                    main_category = Counter(categories).most_common(1)[0][0]
-                    
-                    annotated_files.append({
-                        'stem': ann_file.stem,
-                        'category': main_category
-                    })
-                    
-            except:
-                continue
+        # File annotati con la loro categoria più frequente, già calcolata da scan_dataset
+        annotated_files = [
+            {'stem': stem, 'category': info['main_category']}
+            for stem, info in self.dataset_stats['per_file'].items()
+        ]
         
         if not annotated_files:
             print("❌ No annotated files found!")
             return {}
         
-        # Crea split
+        # Crea split (generatore NumPy seminato da random: random.seed resta riproducibile)
+        rng = np.random.default_rng(random.getrandbits(64))
+        stems = np.array([f['stem'] for f in annotated_files], dtype=object)
+        
         if stratified:
-            # Split stratificato per categoria
-            train_files = []
-            val_files = []
-            
-            # Raggruppa per categoria
-            category_files = defaultdict(list)
-            for file_info in annotated_files:
-                category_files[file_info['category']].append(file_info['stem'])
+            # Split stratificato per categoria: codici in ordine di prima apparizione,
+            # un solo argsort stabile raggruppa i file lasciando l'ordine originale nei gruppi
+            category_codes = {}
+            codes = np.fromiter(
+                (category_codes.setdefault(f['category'], len(category_codes)) for f in annotated_files),
+                dtype=np.int64, count=len(annotated_files)
+            )
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(category_codes) + 1))
             
             # Split per ogni categoria
-            for category, files in category_files.items():
-                random.shuffle(files)
-                split_idx = int(len(files) * train_ratio)
-                train_files.extend(files[:split_idx])
-                val_files.extend(files[split_idx:])
+            train_parts, val_parts = [], []
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+                group = order[start:end].copy()
+                rng.shuffle(group)
+                split_idx = int(len(group) * train_ratio)
+                train_parts.append(group[:split_idx])
+                val_parts.append(group[split_idx:])
+            
+            train_files = stems[np.concatenate(train_parts)].tolist()
+            val_files = stems[np.concatenate(val_parts)].tolist()
                 
         else:
             # Split casuale
-            random.shuffle(annotated_files)
+            perm = rng.permutation(len(annotated_files))
             split_idx = int(len(annotated_files) * train_ratio)
-            train_files = [f['stem'] for f in annotated_files[:split_idx]]
-            val_files = [f['stem'] for f in annotated_files[split_idx:]]
+            train_files = stems[perm[:split_idx]].tolist()
+            val_files = stems[perm[split_idx:]].tolist()
         
         split_info = {
             'train': train_files,
@@ -298,8 +727,12 @@ class JewelryDatasetManager:
         
         return split_info
     
-    def export_yolo_dataset(self, split_info: Optional[Dict] = None) -> str:
-        """Esporta dataset in formato YOLO pronto per training"""
+    def export_yolo_dataset(self, split_info: Optional[Dict] = None,
+                            link_mode: str = 'copy') -> str:
+        """
+        Esporta dataset in formato YOLO pronto per training.
+        link_mode: 'copy' (default), oppure 'hardlink'/'symlink' per non duplicare le immagini
+        """
         print("📦 Exporting YOLO dataset...")
         
         # Crea directory export
@@ -321,28 +754,28 @@ class JewelryDatasetManager:
                 print("⚠️  No split info found, creating new split...")
                 split_info = self.create_train_val_split()
         
-        # Copia file per train e val
+        # Indici costruiti una volta sola al posto di uno stat per file ed estensione
+        stem_to_img = self._image_index()
+        ann_files = set(self._annotation_files())
+        
+        # Copia file per train e val; le label vengono convertite tutte insieme
+        label_jobs = []
         for split_type in ['train', 'val']:
             file_stems = split_info.get(split_type, [])
             
             for stem in file_stems:
                 # Copia immagine
-                img_file = None
-                for ext in ['.jpg', '.jpeg', '.png']:
-                    potential_img = self.raw_images_dir / f"{stem}{ext}"
-                    if potential_img.exists():
-                        img_file = potential_img
-                        break
-                
+                img_file = stem_to_img.get(stem)
                 if img_file:
                     dest_img = export_path / f"images/{split_type}" / img_file.name
-                    shutil.copy2(img_file, dest_img)
+                    _link_or_copy(img_file, dest_img, link_mode)
                 
                 # Converti e copia annotation
                 ann_file = self.annotations_temp_dir / f"{stem}.json"
-                if ann_file.exists():
-                    self.convert_annotation_to_yolo(ann_file, 
-                                                  export_path / f"labels/{split_type}" / f"{stem}.txt")
+                if ann_file in ann_files:
+                    label_jobs.append((ann_file, export_path / f"labels/{split_type}" / f"{stem}.txt"))
+        
+        self._convert_annotations_to_yolo(label_jobs)
         
         # Crea file dataset.yaml
         dataset_yaml = f"""# Jewelry Dataset Configuration
@@ -374,11 +807,64 @@ val_images: {split_info.get('val_count', 0)}
     
     def convert_annotation_to_yolo(self, json_path: Path, yolo_path: Path):
         """Converti annotazione JSON in formato YOLO"""
+        self._convert_annotations_to_yolo([(json_path, yolo_path)])
+    
+    def _convert_annotations_to_yolo(self, jobs: List[Tuple[Path, Path]]):
+        """Converte piu' annotazioni, normalizzando tutte le bbox in un'unica passata NumPy"""
+        outputs = []  # (yolo_path, numero di bbox)
+        cats, boxes, sizes = [], [], []
+        
+        for json_path, yolo_path in jobs:
+            try:
+                metadata = self._load_annotation(json_path)
+                img_h, img_w = self._annotation_image_size(json_path, metadata)
+                extracted = _yolo_box_lists(metadata)
+            except Exception as e:
+                print(f"⚠️  Error converting {json_path}: {e}")
+                continue
+            
+            # Dimensioni non numeriche o nulle: la divisione scalare fallisce a metà file
+            if extracted is None or (extracted[1] and not (
+                    _is_number(img_h) and _is_number(img_w) and img_h and img_w)):
+                self._convert_annotation_scalar(json_path, yolo_path)
+                continue
+            
+            file_cats, file_boxes = extracted
+            outputs.append((yolo_path, len(file_boxes)))
+            cats.extend(file_cats)
+            boxes.extend(file_boxes)
+            sizes.extend([(img_h, img_w)] * len(file_boxes))
+        
+        if not outputs:
+            return
+        
+        # Converti in formato YOLO normalizzato (float64: stessi valori del calcolo scalare)
+        center_x = center_y = width = height = []
+        if boxes:
+            b = np.asarray(boxes, dtype=np.float64)
+            img_h, img_w = np.asarray(sizes, dtype=np.float64).T
+            center_x = ((b[:, 0] + b[:, 2]) / 2.0 / img_w).tolist()
+            center_y = ((b[:, 1] + b[:, 3]) / 2.0 / img_h).tolist()
+            width = ((b[:, 2] - b[:, 0]) / img_w).tolist()
+            height = ((b[:, 3] - b[:, 1]) / img_h).tolist()
+        
+        # Una sola write per file di label
+        start = 0
+        for yolo_path, n in outputs:
+            end = start + n
+            rows = zip(cats[start:end], center_x[start:end], center_y[start:end],
+                       width[start:end], height[start:end])
+            body = (_YOLO_LINE_FORMAT * n) % tuple(v for row in rows for v in row)
+            with open(yolo_path, 'w') as f:
+                f.write(body)
+            start = end
+    
+    def _convert_annotation_scalar(self, json_path: Path, yolo_path: Path):
+        """Conversione bbox per bbox, per le annotazioni con valori irregolari"""
         try:
-            with open(json_path, 'r') as f:
-                metadata = json.load(f)
+            metadata = self._load_annotation(json_path)
             
-            img_h, img_w = metadata['image_size']
+            img_h, img_w = self._annotation_image_size(json_path, metadata)
             bboxes = metadata.get('bboxes', [])
             
             # Compatibilità con formato singolo bbox
@@ -412,7 +898,8 @@ val_images: {split_info.get('val_count', 0)}
         
         stats = self.dataset_stats
         
-        report = f"""
+        # Parti del report unite una sola volta alla fine
+        report = [f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║                    JEWELRY DATASET REPORT                   ║
 ╚══════════════════════════════════════════════════════════════╝
@@ -431,7 +918,7 @@ val_images: {split_info.get('val_count', 0)}
 └── Orphaned Annotations: {len(stats['files']['orphaned_annotations'])}
 
 🎯 CATEGORY DISTRIBUTION
-"""
+"""]
         
         # Aggiungi distribuzione categorie
         total_boxes = sum(stats['category_distribution'].values())
@@ -439,74 +926,96 @@ val_images: {split_info.get('val_count', 0)}
             percentage = (count / total_boxes * 100) if total_boxes > 0 else 0
             bar_length = int(percentage / 2)  # Max 50 caratteri
             bar = "█" * bar_length + "░" * (50 - bar_length)
-            report += f"├── {category:12}: {count:4d} ({percentage:5.1f}%) {bar}\n"
+            report.append(f"├── {category:12}: {count:4d} ({percentage:5.1f}%) {bar}\n")
         
         # Aggiungi statistiche immagini
         if stats['image_sizes']:
             sizes = stats['image_sizes']
-            heights = [s[0] for s in sizes]
-            widths = [s[1] for s in sizes]
+            (h_min, h_max, h_avg), (w_min, w_max, w_avg) = _size_summary(sizes)
             
-            report += f"""
+            report.append(f"""
 📐 IMAGE DIMENSIONS
 ├── Images analyzed: {len(sizes)}
-├── Height - Min: {min(heights)}, Max: {max(heights)}, Avg: {sum(heights)/len(heights):.0f}
-└── Width  - Min: {min(widths)}, Max: {max(widths)}, Avg: {sum(widths)/len(widths):.0f}
-"""
+├── Height - Min: {h_min}, Max: {h_max}, Avg: {h_avg:.0f}
+└── Width  - Min: {w_min}, Max: {w_max}, Avg: {w_avg:.0f}
+""")
         
         # Aggiungi errori di validazione
         if self.validation_errors:
-            report += f"""
+            report.append(f"""
 ⚠️  VALIDATION ERRORS ({len(self.validation_errors)})
-"""
+""")
             for i, error in enumerate(self.validation_errors[:10]):  # Max 10 errori
-                report += f"├── {error}\n"
+                report.append(f"├── {error}\n")
             
             if len(self.validation_errors) > 10:
-                report += f"└── ... and {len(self.validation_errors) - 10} more errors\n"
+                report.append(f"└── ... and {len(self.validation_errors) - 10} more errors\n")
         
         # Raccomandazioni
-        report += """
+        report.append("""
 💡 RECOMMENDATIONS
-"""
+""")
         
         if stats['annotated_images'] < stats['total_images'] * 0.8:
-            report += "├── ⚠️  Consider annotating more images for better training\n"
+            report.append("├── ⚠️  Consider annotating more images for better training\n")
         
         if len(stats['files']['orphaned_images']) > 0:
-            report += "├── 🧹 Clean orphaned images to reduce storage\n"
+            report.append("├── 🧹 Clean orphaned images to reduce storage\n")
         
         # Controlla bilanciamento classi
         if stats['category_distribution']:
             values = list(stats['category_distribution'].values())
             if max(values) > min(values) * 5:  # Sbilanciamento > 5:1
-                report += "├── ⚖️  Dataset is unbalanced, consider collecting more data for underrepresented categories\n"
+                report.append("├── ⚖️  Dataset is unbalanced, consider collecting more data for underrepresented categories\n")
         
         if stats['total_bboxes'] < 1000:
-            report += "├── 📈 Consider collecting more data (recommended: >1000 boxes per class)\n"
+            report.append("├── 📈 Consider collecting more data (recommended: >1000 boxes per class)\n")
         
-        report += f"""
+        report.append(f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║ Report generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}                           ║
 ╚══════════════════════════════════════════════════════════════╝
-"""
+""")
         
-        return report
+        return ''.join(report)
+    
+    # Directory e file di configurazione inclusi nel backup
+    BACKUP_DIRS = [
+        "images/raw",
+        "annotations/temp", 
+        "annotations/yolo"
+    ]
+    BACKUP_CONFIG_FILES = [
+        "collection_stats.json",
+        "train_val_split.json"
+    ]
+    
+    def _backup_manifest_bytes(self, backed_up_files: int) -> bytes:
+        """Manifest del backup serializzato (i Path delle statistiche come stringhe)"""
+        manifest = {
+            'backup_created': datetime.now().isoformat(),
+            'original_path': str(self.dataset_dir),
+            'files_backed_up': backed_up_files,
+            'dataset_stats': self.dataset_stats
+        }
+        return json.dumps(manifest, indent=2, default=str).encode('utf-8')
     
-    def backup_dataset(self) -> str:
-        """Crea backup completo del dataset"""
+    def backup_dataset(self, archive: bool = False) -> str:
+        """
+        Crea backup completo del dataset.
+        archive=True: un unico .tar scritto in streaming invece della copia file per file
+        """
         print("💾 Creating dataset backup...")
         
         backup_name = f"jewelry_dataset_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if archive:
+            return self._backup_to_archive(self.dataset_dir / "backups" / f"{backup_name}.tar")
+        
         backup_path = self.dataset_dir / "backups" / backup_name
         backup_path.mkdir(parents=True, exist_ok=True)
         
         # Directory da includere nel backup
-        dirs_to_backup = [
-            "images/raw",
-            "annotations/temp", 
-            "annotations/yolo"
-        ]
+        dirs_to_backup = self.BACKUP_DIRS
         
         backed_up_files = 0
         
@@ -518,41 +1027,61 @@ val_images: {split_info.get('val_count', 0)}
                 dest_dir.mkdir(parents=True, exist_ok=True)
                 
                 # Copia tutti i file
-                for file_path in source_dir.rglob('*'):
-                    if file_path.is_file():
-                        rel_path = file_path.relative_to(source_dir)
-                        dest_file = dest_dir / rel_path
-                        dest_file.parent.mkdir(parents=True, exist_ok=True)
-                        shutil.copy2(file_path, dest_file)
-                        backed_up_files += 1
+                for file_path, rel_path in _iter_files(str(source_dir)):
+                    dest_file = dest_dir / rel_path
+                    dest_file.parent.mkdir(parents=True, exist_ok=True)
+                    _copy_file(file_path, dest_file)
+                    backed_up_files += 1
         
         # Includi file di configurazione
-        config_files = [
-            "collection_stats.json",
-            "train_val_split.json"
-        ]
-        
-        for config_file in config_files:
+        for config_file in self.BACKUP_CONFIG_FILES:
             source_file = self.dataset_dir / config_file
             if source_file.exists():
-                shutil.copy2(source_file, backup_path / config_file)
+                _copy_file(source_file, backup_path / config_file)
                 backed_up_files += 1
         
         # Crea manifest del backup
-        manifest = {
-            'backup_created': datetime.now().isoformat(),
-            'original_path': str(self.dataset_dir),
-            'files_backed_up': backed_up_files,
-            'dataset_stats': self.dataset_stats
-        }
-        
-        with open(backup_path / "backup_manifest.json", 'w') as f:
-            json.dump(manifest, f, indent=2)
+        with open(backup_path / "backup_manifest.json", 'wb') as f:
+            f.write(self._backup_manifest_bytes(backed_up_files))
         
         print(f"✅ Backup created: {backup_path}")
         print(f"📁 Files backed up: {backed_up_files}")
         
         return str(backup_path)
+    
+    def _backup_to_archive(self, archive_path: Path) -> str:
+        """Backup in un tar non compresso (le JPEG non si comprimono): un solo file di output"""
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        backed_up_files = 0
+        
+        # dereference: come copy2, dei symlink si salva il contenuto
+        with tarfile.open(archive_path, 'w|', dereference=True) as tar:
+            for dir_name in self.BACKUP_DIRS:
+                source_dir = self.dataset_dir / dir_name
+                if not source_dir.exists():
+                    continue
+                for file_path, rel_path in _iter_files(str(source_dir)):
+                    tar.add(file_path, arcname=f"{dir_name}/{rel_path}")
+                    backed_up_files += 1
+            
+            for config_file in self.BACKUP_CONFIG_FILES:
+                source_file = self.dataset_dir / config_file
+                if source_file.exists():
+                    tar.add(source_file, arcname=config_file)
+                    backed_up_files += 1
+            
+            # Manifest aggiunto dalla memoria, senza file temporaneo
+            data = self._backup_manifest_bytes(backed_up_files)
+            info = tarfile.TarInfo("backup_manifest.json")
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+        
+        size_mb = archive_path.stat().st_size / (1024 * 1024)
+        print(f"✅ Backup created: {archive_path} ({size_mb:.1f} MB)")
+        print(f"📁 Files backed up: {backed_up_files}")
+        
+        return str(archive_path)
 
 def main():
     parser = argparse.ArgumentParser(description="Jewelry Dataset Manager")
@@ -567,6 +1096,10 @@ def main():
                        help='Remove orphaned files during cleaning')
     parser.add_argument('--stratified', action='store_true', default=True,
                        help='Use stratified split by category')
+    parser.add_argument('--backup-archive', action='store_true',
+                       help='Write the backup as a single .tar archive')
+    parser.add_argument('--link-mode', type=str, choices=EXPORT_LINK_MODES, default='copy',
+                       help='How export places images: copy, hardlink or symlink (default: copy)')
     
     args = parser.parse_args()
     
@@ -593,11 +1126,11 @@ def main():
         print(f"✅ Train/val split created")
     
     if args.action == 'export' or args.action == 'all':
-        export_path = manager.export_yolo_dataset()
+        export_path = manager.export_yolo_dataset(link_mode=args.link_mode)
         print(f"✅ YOLO dataset exported to: {export_path}")
     
     if args.action == 'backup' or args.action == 'all':
-        backup_path = manager.backup_dataset()
+        backup_path = manager.backup_dataset(archive=args.backup_archive)
         print(f"✅ Backup created at: {backup_path}")
     
     if args.action == 'report' or args.action == 'all':
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Jewelry Engine Export
+Esporta YOLO11n in un engine TensorRT (FP16 o INT8) per jewelry_detector.py
+
+Da eseguire una volta sul Jetson di destinazione: gli engine TensorRT non sono
+portabili tra GPU o versioni di TensorRT/JetPack diverse.
+"""
+
+import argparse
+from pathlib import Path
+
+from ultralytics import YOLO
+
+
+def export_engine(weights: str = 'yolo11n.pt', imgsz: int = 320, int8: bool = False,
+                  data: str = None, workspace: float = 4) -> str:
+    """Esporta weights in formato engine, restituisce il percorso dell'engine creato"""
+    if int8:
+        if not data:
+            raise ValueError("INT8 richiede --data con frame rappresentativi per la calibrazione")
+        # Una cache di calibrazione vecchia verrebbe riusata alla cieca da TensorRT
+        Path(weights).with_suffix('.cache').unlink(missing_ok=True)
+
+    model = YOLO(weights)
+    engine_path = model.export(
+        format='engine',
+        half=not int8,
+        int8=int8,
+        data=data,
+        imgsz=imgsz,
+        dynamic=False,
+        simplify=True,
+        workspace=workspace,
+    )
+    return str(engine_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jewelry Engine Export")
+    parser.add_argument('--weights', type=str, default='yolo11n.pt',
+                       help='PyTorch weights to export (default: yolo11n.pt)')
+    parser.add_argument('--imgsz', type=int, default=320,
+                       help='Inference size baked into the engine, must match '
+                            'INFERENCE_SIZE in jewelry_detector.py (default: 320)')
+    parser.add_argument('--int8', action='store_true',
+                       help='INT8 with calibration instead of FP16')
+    parser.add_argument('--data', type=str, default=None,
+                       help='Dataset yaml for INT8 calibration, e.g. the dataset.yaml '
+                            'written by dataset_manager.py --action export (~200 frames)')
+    parser.add_argument('--workspace', type=float, default=4,
+                       help='TensorRT builder workspace in GiB (default: 4)')
+
+    args = parser.parse_args()
+
+    print(f"⚙️  Exporting {args.weights} to TensorRT ({'INT8' if args.int8 else 'FP16'}, imgsz={args.imgsz})...")
+    engine_path = export_engine(args.weights, args.imgsz, args.int8, args.data, args.workspace)
+    print(f"✅ Engine saved to: {engine_path}")
+
+
+if __name__ == "__main__":
+    main()
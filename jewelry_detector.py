@@ -14,6 +14,7 @@ Autori: Team Jewelry Vision
 Data: Settembre 2024
 """
 
+import argparse
 import cv2
 import numpy as np
 import time
@@ -21,47 +22,168 @@ from datetime import datetime
 from ultralytics import YOLO
 import json
 import os
+import queue
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Modello: engine TensorRT (creato da export_engine.py sul Jetson) se presente, altrimenti PyTorch
+MODEL_ENGINE = 'yolo11n.engine'
+MODEL_WEIGHTS = 'yolo11n.pt'
+
+# Lato di inferenza: i gioielli occupano gran parte del frame, 320 basta e costa ~1/4 di 640.
+# Deve coincidere con l'imgsz con cui e' stato esportato l'engine
+INFERENCE_SIZE = 320
+
+# Inferenze a vuoto all'avvio: primo kernel CUDA/contesto TensorRT fuori dai loop
+WARMUP_RUNS = 3
+
+# OpenCV con CUDA opzionale (JetPack): preprocessing anti-riflessi sulla GPU
+try:
+    CV2_CUDA_AVAILABLE = cv2.cuda.getCudaEnabledDeviceCount() > 0
+except (AttributeError, cv2.error):
+    CV2_CUDA_AVAILABLE = False
+
+# Stato di riferimento: header JSON (data, totali, categorie) + oggetti in SoA NumPy
+REFERENCE_DIR = 'data/reference'
+REFERENCE_HEADER = os.path.join(REFERENCE_DIR, 'reference_state.json')
+REFERENCE_ARRAYS = os.path.join(REFERENCE_DIR, 'reference.npz')
+
+# Risoluzione di acquisizione (larghezza, altezza): con inferenza a 320 basta 640x480,
+# 1280x720 solo per un'anteprima piu' nitida (--hires-display)
+CAPTURE_SIZE = (640, 480)
+HIRES_CAPTURE_SIZE = (1280, 720)
+
+
+def _gstreamer_pipeline(camera_id: int, width: int, height: int) -> str:
+    """
+    Pipeline GStreamer per Jetson: conversione colore/scala in NVMM con nvvidconv
+    (VIC hardware) invece che su CPU; appsink tiene solo l'ultimo frame
+    """
+    return (
+        f"v4l2src device=/dev/video{camera_id} ! "
+        f"video/x-raw,width={width},height={height} ! "
+        "nvvidconv ! video/x-raw(memory:NVMM),format=NV12 ! "
+        "nvvidconv ! video/x-raw,format=BGRx ! "
+        "videoconvert ! video/x-raw,format=BGR ! "
+        "appsink drop=1 max-buffers=1"
+    )
+
+
+def _put_latest(q: queue.Queue, item):
+    """Mette item in una coda di capienza 1 scartando l'elemento non ancora consumato"""
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def _detections_to_arrays(detections) -> dict:
+    """Lista di detection (dict) -> struttura di array: un'operazione NumPy per tutti gli oggetti"""
+    return {
+        'bbox_xyxy': np.array([det['bbox'] for det in detections], np.int32).reshape(-1, 4),
+        'class_ids': np.array([det['class_id'] for det in detections], np.int32),
+        'confidences': np.array([det['confidence'] for det in detections], np.float32),
+        'centers': np.array([det['center'] for det in detections], np.int32).reshape(-1, 2),
+    }
+
 
 class JewelryVisionSystem:
-    def __init__(self):
+    # Attesa massima dei thread della pipeline prima di ricontrollare lo stop
+    PIPELINE_POLL = 0.1
+    # Attesa massima in uscita per ogni thread (un cap.read() bloccato non blocca il menu)
+    PIPELINE_JOIN_TIMEOUT = 2.0
+    
+    def __init__(self, hires_display: bool = False):
         print("🔍 Inizializzazione Sistema Jewelry Vision...")
         
         # Configurazione
         self.camera_id = 0
+        self.capture_size = HIRES_CAPTURE_SIZE if hires_display else CAPTURE_SIZE
         self.confidence_threshold = 0.5
         self.reference_state = {}
+        self.reference_objects = _detections_to_arrays([])
+        self._ref_counter = Counter()
         self.current_objects = []
         self.is_calibrated = False
         self.monitoring = False
         
+        # Preprocessing anti-riflessi (LAB + CLAHE): disattivo di default, YOLO11 regge
+        # già i riflessi; attivabile dal menu per confrontare detection e FPS
+        self.enable_clahe = False
+        
+        # Monitoraggio e live: detection ogni detect_stride frame, negli altri si
+        # riusano le ultime detection (display a piena frequenza, metà carico GPU)
+        self.detect_stride = 2
+        
+        # Cache del disegno: dimensioni delle label ripetute di frame in frame
+        self._text_size_cache = {}
+        
+        # CLAHE creato una volta sola; su GPU anche stream e buffer di upload persistenti
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+        self.use_cuda = CV2_CUDA_AVAILABLE
+        if self.use_cuda:
+            self.cuda_stream = cv2.cuda.Stream()
+            self.clahe_gpu = cv2.cuda.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+            self.gpu_frame = cv2.cuda_GpuMat()
+        
         # Carica modello YOLO11
         print("📥 Caricamento YOLO11...")
-        self.model = YOLO('yolo11n.pt')
-        print("✅ Modello caricato")
+        model_path = MODEL_ENGINE if os.path.exists(MODEL_ENGINE) else MODEL_WEIGHTS
+        self.model = YOLO(model_path, task='detect')
+        self._warmup_model()
+        print(f"✅ Modello caricato ({model_path})")
         
         # Inizializza telecamera
         print("📷 Inizializzazione telecamera...")
-        self.cap = cv2.VideoCapture(self.camera_id)
-        if not self.cap.isOpened():
-            raise Exception("❌ Errore apertura telecamera")
-            
-        # Imposta risoluzione ottimale
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.cap = self._open_camera()
         
         print("✅ Telecamera inizializzata")
         print("🎯 Sistema pronto!")
     
+    def _open_camera(self):
+        """Apre la telecamera via GStreamer/NVMM, altrimenti ripiega su V4L2 diretto"""
+        width, height = self.capture_size
+        cap = cv2.VideoCapture(_gstreamer_pipeline(self.camera_id, width, height),
+                               cv2.CAP_GSTREAMER)
+        if cap.isOpened():
+            print("📷 Pipeline GStreamer (NVMM) attiva")
+            return cap
+        
+        # OpenCV senza GStreamer o senza nvvidconv (es. fuori dal Jetson)
+        cap = cv2.VideoCapture(self.camera_id)
+        if not cap.isOpened():
+            raise Exception("❌ Errore apertura telecamera")
+            
+        # Imposta risoluzione ottimale
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    
     def preprocess_frame(self, frame):
         """Preprocessa frame per ridurre riflessi e migliorare detection"""
+        if not self.enable_clahe:
+            return frame
+        
+        if self.use_cuda:
+            try:
+                return self._preprocess_frame_gpu(frame)
+            except cv2.error as e:
+                print(f"⚠️ Preprocessing CUDA non disponibile, uso la CPU: {e}")
+                self.use_cuda = False
+        
         # Conversione in LAB per lavorare sulla luminanza
         lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
         l, a, b = cv2.split(lab)
         
         # Applica CLAHE per equalizzazione adattiva
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        l_enhanced = clahe.apply(l)
+        l_enhanced = self.clahe.apply(l)
         
         # Riduce highlights estremi (anti-riflessi)
         l_enhanced = np.clip(l_enhanced, 0, 240)
@@ -72,49 +194,171 @@ class JewelryVisionSystem:
         
         return enhanced_frame
     
+    def _preprocess_frame_gpu(self, frame):
+        """Stesso preprocessing di preprocess_frame, con il frame residente in memoria GPU"""
+        stream = self.cuda_stream
+        self.gpu_frame.upload(frame, stream)
+        
+        lab = cv2.cuda.cvtColor(self.gpu_frame, cv2.COLOR_BGR2LAB, stream=stream)
+        l, a, b = cv2.cuda.split(lab, stream=stream)
+        l_enhanced = self.clahe_gpu.apply(l, stream)
+        
+        # Riduce highlights estremi (anti-riflessi): troncamento a 240
+        _, l_enhanced = cv2.cuda.threshold(l_enhanced, 240, 255, cv2.THRESH_TRUNC, stream=stream)
+        
+        lab_enhanced = cv2.cuda.merge([l_enhanced, a, b], stream=stream)
+        enhanced_gpu = cv2.cuda.cvtColor(lab_enhanced, cv2.COLOR_LAB2BGR, stream=stream)
+        
+        enhanced_frame = enhanced_gpu.download(stream=stream)
+        stream.waitForCompletion()
+        return enhanced_frame
+    
+    def _predict(self, frame):
+        """Inferenza YOLO: il predictor creato dalla prima chiamata resta riusato"""
+        return self.model.predict(frame, conf=self.confidence_threshold, imgsz=INFERENCE_SIZE,
+                                  half=True, verbose=False)
+    
+    def _warmup_model(self):
+        """Prime inferenze su un frame nero: allocazioni e autotuning non pesano sul primo frame reale"""
+        blank = np.zeros((INFERENCE_SIZE, INFERENCE_SIZE, 3), np.uint8)
+        for _ in range(WARMUP_RUNS):
+            self._predict(blank)
+    
     def detect_objects(self, frame):
         """Rileva oggetti nel frame usando YOLO11"""
         # Preprocessa per migliorare detection
         processed_frame = self.preprocess_frame(frame)
         
         # Inferenza YOLO
-        results = self.model(processed_frame, conf=self.confidence_threshold, verbose=False)
+        results = self._predict(processed_frame)
         
         # Estrai detections
         detections = []
         if results and len(results) > 0 and results[0].boxes is not None:
             boxes = results[0].boxes
-            for box in boxes:
-                # Coordinate bbox
-                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = int(box.cls[0].cpu().numpy())
-                class_name = self.model.names[class_id]
-                
+            
+            # Un solo trasferimento GPU -> host per tensore, non tre per box
+            xyxy = boxes.xyxy.cpu().numpy().astype(np.int32)
+            confs = boxes.conf.cpu().numpy().tolist()
+            class_ids = boxes.cls.cpu().numpy().astype(np.int32).tolist()
+            
+            # Centri e aree vettorizzati; tolist() da' int Python, serializzabili in JSON
+            centers = ((xyxy[:, :2] + xyxy[:, 2:]) // 2).tolist()
+            areas = ((xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])).tolist()
+            
+            for bbox, confidence, class_id, center, area in zip(
+                    xyxy.tolist(), confs, class_ids, centers, areas):
                 detection = {
-                    'bbox': [x1, y1, x2, y2],
+                    'bbox': bbox,
                     'confidence': confidence,
-                    'class_name': class_name,
+                    'class_name': self.model.names[class_id],
                     'class_id': class_id,
-                    'center': [(x1+x2)//2, (y1+y2)//2],
-                    'area': (x2-x1) * (y2-y1)
+                    'center': center,
+                    'area': area
                 }
                 detections.append(detection)
         
         return detections, processed_frame
     
-    def draw_detections(self, frame, detections, title="Detection"):
-        """Disegna bounding boxes e info sulle detection"""
-        annotated_frame = frame.copy()
+    def _capture_worker(self, frames: queue.Queue, stop: threading.Event):
+        """Stadio 1: acquisisce di continuo, lascia in coda solo il frame piu' recente"""
+        while not stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                continue
+            _put_latest(frames, frame)
+    
+    def _inference_worker(self, frames: queue.Queue, results: queue.Queue, stride: int,
+                          stop: threading.Event):
+        """
+        Stadio 2: preprocessing + inferenza sull'ultimo frame disponibile, uno ogni
+        stride; gli altri frame passano subito con le detection precedenti.
+        detection_seq conta le inferenze vere: un frame saltato puo' rimpiazzare in
+        coda un risultato fresco non ancora letto, il numero di sequenza no
+        """
+        frame_index = 0
+        detection_seq = 0
+        detections = []
+        while not stop.is_set():
+            try:
+                frame = frames.get(timeout=self.PIPELINE_POLL)
+            except queue.Empty:
+                continue
+            detect = frame_index % stride == 0
+            frame_index += 1
+            if detect:
+                detections, processed_frame = self.detect_objects(frame)
+                detection_seq += 1
+            else:
+                processed_frame = frame
+            _put_latest(results, (frame, detections, processed_frame, detection_seq))
+    
+    @staticmethod
+    def _pipeline_stage(worker, errors: list, stop: threading.Event, *args):
+        """Esegue uno stadio; un'eccezione ferma la pipeline e viene rilanciata al thread principale"""
+        try:
+            worker(*args, stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+    
+    @contextmanager
+    def _detection_pipeline(self, stride: int = 1):
+        """
+        Avvia acquisizione e inferenza su thread separati; il thread principale
+        (disegno, imshow, tasti) riceve una funzione che restituisce l'ultimo
+        (frame, detections, processed_frame, detection_seq), o None se non ancora pronto.
+        detection_seq cambia solo con una nuova inferenza (frame saltati dallo stride no).
+        Se uno stadio solleva un'eccezione, la funzione la rilancia
+        """
+        frames = queue.Queue(maxsize=1)
+        results = queue.Queue(maxsize=1)
+        stop = threading.Event()
+        errors = []
+        workers = [
+            threading.Thread(target=self._pipeline_stage,
+                             args=(self._capture_worker, errors, stop, frames), daemon=True),
+            threading.Thread(target=self._pipeline_stage,
+                             args=(self._inference_worker, errors, stop, frames, results, stride),
+                             daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+        
+        def next_result():
+            if errors:
+                raise errors[0]
+            try:
+                return results.get(timeout=self.PIPELINE_POLL)
+            except queue.Empty:
+                return None
+        
+        try:
+            yield next_result
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join(timeout=self.PIPELINE_JOIN_TIMEOUT)
+    
+    def _text_size(self, label, scale, thickness):
+        """cv2.getTextSize memoizzato: le label si ripetono di frame in frame"""
+        key = (label, scale, thickness)
+        size = self._text_size_cache.get(key)
+        if size is None:
+            size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)[0]
+            self._text_size_cache[key] = size
+        return size
+    
+    def draw_detections(self, frame, detections, title="Detection", in_place=False):
+        """Disegna bounding boxes e info sulle detection (in_place: disegna sul frame stesso)"""
+        annotated_frame = frame if in_place else frame.copy()
         
         # Titolo
-        cv2.putText(annotated_frame, title, (10, 30), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        cv2.putText(annotated_frame, title, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         
         # Info generale
         info_text = f"Oggetti rilevati: {len(detections)}"
-        cv2.putText(annotated_frame, info_text, (10, 60), 
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        cv2.putText(annotated_frame, info_text, (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
         
         # Disegna ogni detection
         for i, det in enumerate(detections):
@@ -128,7 +372,7 @@ class JewelryVisionSystem:
             
             # Label con confidence
             label = f"{class_name}: {conf:.2f}"
-            label_size = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+            label_size = self._text_size(label, 0.5, 1)
             
             # Background per label
             cv2.rectangle(annotated_frame, (x1, y1-20), (x1 + label_size[0], y1), color, -1)
@@ -147,66 +391,81 @@ class JewelryVisionSystem:
         print("Posizionate tutti i gioielli da monitorare e premete SPAZIO per calibrare")
         print("Premete ESC per annullare")
         
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
+        with self._detection_pipeline() as next_result:
+            while True:
+                # Oggetti rilevati dal thread di inferenza
+                result = next_result()
+                if result is None:
+                    # Nessun frame nuovo: la finestra resta reattiva a ESC
+                    if cv2.waitKey(1) & 0xFF == 27:
+                        print("❌ Calibrazione annullata")
+                        break
+                    continue
+                frame, detections, processed_frame, _ = result
                 
-            # Rileva oggetti
-            detections, processed_frame = self.detect_objects(frame)
-            
-            # Disegna detection
-            display_frame = self.draw_detections(frame, detections, "CALIBRAZIONE - SPAZIO per confermare")
-            
-            # Mostra
-            cv2.imshow('Jewelry Calibration', display_frame)
-            
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord(' '):  # SPAZIO per calibrare
-                if len(detections) > 0:
-                    self.reference_state = {
-                        'timestamp': datetime.now().isoformat(),
-                        'total_objects': len(detections),
-                        'objects': detections.copy(),
-                        'categories': {}
-                    }
-                    
-                    # Conta per categoria
-                    for det in detections:
-                        cat = det['class_name']
-                        self.reference_state['categories'][cat] = self.reference_state['categories'].get(cat, 0) + 1
-                    
-                    self.is_calibrated = True
-                    print(f"\n✅ CALIBRAZIONE COMPLETATA!")
-                    print(f"📦 Oggetti di riferimento: {len(detections)}")
-                    print("📋 Categorie rilevate:")
-                    for cat, count in self.reference_state['categories'].items():
-                        print(f"   - {cat}: {count}")
-                    
-                    # Salva stato di riferimento
-                    self.save_reference_state()
+                # Disegna detection
+                display_frame = self.draw_detections(frame, detections, "CALIBRAZIONE - SPAZIO per confermare", in_place=True)
+                
+                # Mostra
+                cv2.imshow('Jewelry Calibration', display_frame)
+                
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord(' '):  # SPAZIO per calibrare
+                    if len(detections) > 0:
+                        self.reference_state = {
+                            'timestamp': datetime.now().isoformat(),
+                            'total_objects': len(detections),
+                            'categories': {}
+                        }
+                        self.reference_objects = _detections_to_arrays(detections)
+                        
+                        # Conta per categoria
+                        for det in detections:
+                            cat = det['class_name']
+                            self.reference_state['categories'][cat] = self.reference_state['categories'].get(cat, 0) + 1
+                        self._ref_counter = Counter(self.reference_state['categories'])
+                        
+                        self.is_calibrated = True
+                        print(f"\n✅ CALIBRAZIONE COMPLETATA!")
+                        print(f"📦 Oggetti di riferimento: {len(detections)}")
+                        print("📋 Categorie rilevate:")
+                        for cat, count in self.reference_state['categories'].items():
+                            print(f"   - {cat}: {count}")
+                        
+                        # Salva stato di riferimento
+                        self.save_reference_state()
+                        break
+                    else:
+                        print("⚠️ Nessun oggetto rilevato. Riposizionate i gioielli.")
+                        
+                elif key == 27:  # ESC per uscire
+                    print("❌ Calibrazione annullata")
                     break
-                else:
-                    print("⚠️ Nessun oggetto rilevato. Riposizionate i gioielli.")
-                    
-            elif key == 27:  # ESC per uscire
-                print("❌ Calibrazione annullata")
-                break
         
         cv2.destroyAllWindows()
     
     def save_reference_state(self):
-        """Salva lo stato di riferimento su file"""
-        os.makedirs('data/reference', exist_ok=True)
-        with open('data/reference/reference_state.json', 'w') as f:
+        """Salva lo stato di riferimento su file (array prima, header JSON dopo)"""
+        os.makedirs(REFERENCE_DIR, exist_ok=True)
+        np.savez_compressed(REFERENCE_ARRAYS, **self.reference_objects)
+        with open(REFERENCE_HEADER, 'w') as f:
             json.dump(self.reference_state, f, indent=2)
         print("💾 Stato di riferimento salvato")
     
     def load_reference_state(self):
-        """Carica stato di riferimento da file"""
+        """Carica stato di riferimento da file (anche nel vecchio formato JSON con 'objects')"""
         try:
-            with open('data/reference/reference_state.json', 'r') as f:
-                self.reference_state = json.load(f)
+            with open(REFERENCE_HEADER, 'r') as f:
+                reference_state = json.load(f)
+            if 'objects' in reference_state:
+                # Formato precedente: oggetti come lista di dict dentro il JSON
+                reference_objects = _detections_to_arrays(reference_state.pop('objects'))
+            else:
+                with np.load(REFERENCE_ARRAYS) as arrays:
+                    reference_objects = {name: arrays[name] for name in arrays.files}
+            self.reference_state = reference_state
+            self.reference_objects = reference_objects
+            self._ref_counter = Counter(reference_state['categories'])
             self.is_calibrated = True
             print("📂 Stato di riferimento caricato")
             print(f"📦 Oggetti di riferimento: {self.reference_state['total_objects']}")
@@ -227,68 +486,85 @@ class JewelryVisionSystem:
         
         alert_count = 0
         frame_count = 0
+        last_detection_seq = 0
         
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-            
-            frame_count += 1
-            
-            # Rileva oggetti attuali
-            detections, processed_frame = self.detect_objects(frame)
-            current_count = len(detections)
-            reference_count = self.reference_state['total_objects']
-            
-            # Analizza differenza
-            missing_objects = reference_count - current_count
-            
-            # Determina stato
-            if missing_objects > 0:
-                status = "🚨 ALERT"
-                status_color = (0, 0, 255)  # Rosso
-                alert_count += 1
-            elif missing_objects < 0:
-                status = "⚠️ EXTRA"
-                status_color = (0, 165, 255)  # Arancione
-            else:
-                status = "✅ OK"
-                status_color = (0, 255, 0)  # Verde
-                alert_count = 0
-            
-            # Disegna detection
-            title = f"SECURITY - {status} | Rif: {reference_count} | Att: {current_count}"
-            display_frame = self.draw_detections(frame, detections, title)
-            
-            # Info stato in alto
-            status_text = f"Status: {status}"
-            if missing_objects != 0:
-                status_text += f" | Differenza: {abs(missing_objects)}"
-            
-            cv2.putText(display_frame, status_text, (10, 90), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-            
-            # Timestamp
-            timestamp = datetime.now().strftime("%H:%M:%S")
-            cv2.putText(display_frame, f"Time: {timestamp}", (10, 120), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Alert persistente
-            if alert_count > 5:  # Alert per 5 frame consecutivi
-                cv2.rectangle(display_frame, (0, 0), (display_frame.shape[1], 50), (0, 0, 255), -1)
-                cv2.putText(display_frame, "SECURITY ALERT!", (20, 30), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        with self._detection_pipeline(self.detect_stride) as next_result:
+            while True:
+                # Oggetti attuali dal thread di inferenza
+                result = next_result()
+                if result is None:
+                    # Nessun frame nuovo: la finestra resta reattiva a ESC
+                    if cv2.waitKey(1) & 0xFF == 27:
+                        break
+                    continue
+                frame, detections, processed_frame, detection_seq = result
+                fresh_detection = detection_seq != last_detection_seq
+                last_detection_seq = detection_seq
                 
-                # Log alert
-                if frame_count % 30 == 0:  # Log ogni secondo circa
-                    print(f"🚨 ALERT: {missing_objects} oggetti mancanti alle {timestamp}")
-            
-            # Mostra
-            cv2.imshow('Jewelry Security Monitor', display_frame)
-            
-            key = cv2.waitKey(1) & 0xFF
-            if key == 27:  # ESC per uscire
-                break
+                frame_count += 1
+                
+                current_count = len(detections)
+                reference_count = self.reference_state['total_objects']
+                
+                # Analizza differenza per categoria: un anello tolto e una moneta
+                # aggiunta non si compensano come farebbero i soli totali
+                current_counter = Counter(det['class_name'] for det in detections)
+                missing = self._ref_counter - current_counter
+                extra = current_counter - self._ref_counter
+                missing_objects = sum(missing.values())
+                extra_objects = sum(extra.values())
+                
+                # Determina stato
+                if missing_objects > 0:
+                    status = "🚨 ALERT"
+                    status_color = (0, 0, 255)  # Rosso
+                    difference = missing_objects
+                    if fresh_detection:  # Conta solo le detection nuove, non quelle riusate
+                        alert_count += 1
+                elif extra_objects > 0:
+                    status = "⚠️ EXTRA"
+                    status_color = (0, 165, 255)  # Arancione
+                    difference = extra_objects
+                else:
+                    status = "✅ OK"
+                    status_color = (0, 255, 0)  # Verde
+                    difference = 0
+                    alert_count = 0
+                
+                # Disegna detection
+                title = f"SECURITY - {status} | Rif: {reference_count} | Att: {current_count}"
+                display_frame = self.draw_detections(frame, detections, title, in_place=True)
+                
+                # Info stato in alto
+                status_text = f"Status: {status}"
+                if difference:
+                    status_text += f" | Differenza: {difference}"
+                
+                cv2.putText(display_frame, status_text, (10, 90), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+                
+                # Timestamp
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                cv2.putText(display_frame, f"Time: {timestamp}", (10, 120), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                
+                # Alert persistente
+                if alert_count > 5:  # Alert per 5 detection consecutive
+                    cv2.rectangle(display_frame, (0, 0), (display_frame.shape[1], 50), (0, 0, 255), -1)
+                    cv2.putText(display_frame, "SECURITY ALERT!", (20, 30), 
+                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                    
+                    # Log alert
+                    if frame_count % 30 == 0:  # Log ogni secondo circa
+                        missing_text = ", ".join(f"{cat}: {count}" for cat, count in missing.items())
+                        print(f"🚨 ALERT: {missing_objects} oggetti mancanti ({missing_text}) alle {timestamp}")
+                
+                # Mostra
+                cv2.imshow('Jewelry Security Monitor', display_frame)
+                
+                key = cv2.waitKey(1) & 0xFF
+                if key == 27:  # ESC per uscire
+                    break
         
         cv2.destroyAllWindows()
     
@@ -299,34 +575,39 @@ class JewelryVisionSystem:
         
         fps_count = 0
         fps_time = time.time()
+        fps = 0.0
         
-        while True:
-            ret, frame = self.cap.read()
-            if not ret:
-                continue
-            
-            fps_count += 1
-            
-            # Detection
-            detections, processed_frame = self.detect_objects(frame)
-            
-            # Disegna
-            display_frame = self.draw_detections(frame, detections, "LIVE DETECTION")
-            
-            # FPS
-            if time.time() - fps_time >= 1.0:
-                fps = fps_count / (time.time() - fps_time)
-                fps_count = 0
-                fps_time = time.time()
+        with self._detection_pipeline(self.detect_stride) as next_result:
+            while True:
+                # Detection dal thread di inferenza
+                result = next_result()
+                if result is None:
+                    # Nessun frame nuovo: la finestra resta reattiva a ESC
+                    if cv2.waitKey(1) & 0xFF == 27:
+                        break
+                    continue
+                frame, detections, processed_frame, _ = result
                 
-            cv2.putText(display_frame, f"FPS: {fps:.1f}", (10, 150), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            
-            cv2.imshow('Jewelry Live Detection', display_frame)
-            
-            key = cv2.waitKey(1) & 0xFF
-            if key == 27:  # ESC
-                break
+                fps_count += 1
+                
+                # Disegna
+                display_frame = self.draw_detections(frame, detections, "LIVE DETECTION", in_place=True)
+                
+                # FPS
+                if time.time() - fps_time >= 1.0:
+                    fps = fps_count / (time.time() - fps_time)
+                    fps_count = 0
+                    fps_time = time.time()
+                    
+                clahe_state = "ON" if self.enable_clahe else "OFF"
+                cv2.putText(display_frame, f"FPS: {fps:.1f} | CLAHE: {clahe_state}", (10, 150), 
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+                
+                cv2.imshow('Jewelry Live Detection', display_frame)
+                
+                key = cv2.waitKey(1) & 0xFF
+                if key == 27:  # ESC
+                    break
         
         cv2.destroyAllWindows()
     
@@ -341,6 +622,7 @@ class JewelryVisionSystem:
             print("3. 👁️  Monitoraggio Sicurezza")
             print("4. 📂 Carica Calibrazione Esistente")
             print("5. 📊 Stato Sistema")
+            print(f"6. ✨ Preprocessing anti-riflessi (CLAHE): {'ON' if self.enable_clahe else 'OFF'}")
             print("0. 🚪 Esci")
             print("="*60)
             
@@ -362,6 +644,8 @@ class JewelryVisionSystem:
                 elif choice == "5":
                     print(f"\n📊 STATO SISTEMA:")
                     print(f"🎯 Calibrato: {'✅ Sì' if self.is_calibrated else '❌ No'}")
+                    print(f"✨ CLAHE: {'ON' if self.enable_clahe else 'OFF'}")
+                    print(f"📷 Acquisizione: {self.capture_size[0]}x{self.capture_size[1]}")
                     if self.is_calibrated:
                         print(f"📦 Oggetti riferimento: {self.reference_state['total_objects']}")
                         print(f"📅 Data calibrazione: {self.reference_state['timestamp']}")
@@ -369,6 +653,10 @@ class JewelryVisionSystem:
                         for cat, count in self.reference_state['categories'].items():
                             print(f"   - {cat}: {count}")
                     
+                elif choice == "6":
+                    self.enable_clahe = not self.enable_clahe
+                    print(f"✨ Preprocessing anti-riflessi {'attivato' if self.enable_clahe else 'disattivato'}")
+                    
                 elif choice == "0":
                     print("👋 Arrivederci!")
                     break
@@ -389,6 +677,12 @@ class JewelryVisionSystem:
 
 def main():
     """Funzione principale"""
+    parser = argparse.ArgumentParser(description="Jewelry Vision System")
+    parser.add_argument('--hires-display', action='store_true',
+                       help='Capture at 1280x720 for a sharper preview (default: 640x480, '
+                            'enough for inference at 320)')
+    args = parser.parse_args()
+    
     print("=" * 80)
     print("🔍 SISTEMA DI VISIONE ARTIFICIALE PER GIOIELLI")
     print("   Jetson Orin Nano Super + YOLO11 + OpenCV")
@@ -397,7 +691,7 @@ def main():
     
     try:
         # Inizializza sistema
-        system = JewelryVisionSystem()
+        system = JewelryVisionSystem(hires_display=args.hires_display)
         
         # Avvia menu
         system.run_menu()
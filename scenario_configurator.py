@@ -3,108 +3,261 @@ Scenario Configurator - Sistema di configurazione dinamica
 Permette di creare e gestire scenari personalizzati
 """
 
+import functools
 import json
+import mmap
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import logging
 from datetime import datetime
 
+# orjson opzionale: serializzazione piu' veloce degli scenari
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# pysimdjson opzionale: parser riutilizzato per la lettura degli scenari
+try:
+    import simdjson
+    SIMDJSON_AVAILABLE = True
+except ImportError:
+    simdjson = None
+    SIMDJSON_AVAILABLE = False
+
+# Un simdjson.Parser non e' thread-safe: ne teniamo uno per thread
+_simd_local = threading.local()
+
+# Worker massimi per il caricamento parallelo degli scenari
+_MAX_LOAD_WORKERS = 8
+
+# Da quanti file scenario in su conviene il parsing in blocco
+_BULK_PARSE_MIN_FILES = 16
+
+# Ogni quanti secondi ricontrollare su disco il modello jewelry custom
+_JEWELRY_MODEL_CHECK_TTL = 5.0
+
+
+# Sotto questa dimensione il costo di setup di mmap supera la copia del read()
+_MMAP_MIN_SIZE = 4096
+
+
+def _get_simd_parser():
+    """Restituisce il simdjson.Parser del thread corrente"""
+    parser = getattr(_simd_local, 'parser', None)
+    if parser is None:
+        parser = _simd_local.parser = simdjson.Parser()
+    return parser
+
+
+def _parse_json_bytes(data) -> Any:
+    """Decodifica un documento JSON nel parser piu' veloce disponibile"""
+    if SIMDJSON_AVAILABLE:
+        # recursive=True restituisce oggetti Python nativi: i proxy di simdjson
+        # sono validi solo fino al parse successivo e non sono serializzabili
+        return _get_simd_parser().parse(data, True)
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(bytes(data))
+
+
+def _bulk_parse_scenario_files(paths: List[str]) -> Optional[List[Any]]:
+    """
+    Parsa tutti i file scenario come un unico array JSON, ammortizzando il
+    setup del parser. None se un file non e' leggibile o non e' un documento
+    valido: il chiamante ricade sul parsing per file che logga l'errore puntuale
+    """
+    try:
+        chunks = [Path(p).read_bytes() for p in paths]
+        docs = _parse_json_bytes(b'[' + b','.join(chunks) + b']')
+    except Exception:
+        return None
+    
+    if not isinstance(docs, list) or len(docs) != len(paths):
+        return None
+    return docs
+
+
+def _load_scenario_file(path) -> Dict[str, Any]:
+    """Legge un file scenario, mappandolo in memoria se abbastanza grande"""
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _MMAP_MIN_SIZE:
+            return _parse_json_bytes(f.read())
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            # La view va rilasciata prima della chiusura della mappa
+            with memoryview(mm) as view:
+                return _parse_json_bytes(view)
+
+
+def _write_file_atomic(path: Path, data: bytes):
+    """Scrive data su un file temporaneo e lo sostituisce a path in un colpo solo"""
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+        # Il file non verra' riletto a breve: libera le pagine dalla page cache
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(fd, 0, len(data), os.POSIX_FADV_DONTNEED)
+    except BaseException:
+        os.close(fd)
+        tmp.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+    os.replace(tmp, path)
+
+
+# Minuscolo ASCII + spazio -> underscore in un solo passaggio di str.translate
+_SLUGIFY_TABLE = str.maketrans({**{chr(c): chr(c + 32) for c in range(0x41, 0x5B)}, ' ': '_'})
+
+
+def _slugify_scenario_name(name: str) -> str:
+    """Nome file dello scenario: equivalente a name.lower().replace(' ', '_')"""
+    if name.isascii():
+        return name.translate(_SLUGIFY_TABLE)
+    # Maiuscole non ASCII (es. lettere accentate): serve il lower() Unicode completo
+    return name.lower().replace(' ', '_')
+
+
+# Template di scenari pre-configurati, costruiti una sola volta all'import.
+# Condivisi tra istanze e da trattare in sola lettura: ogni istanza ne fa solo una copia
+# superficiale, perche' create_custom_scenario aggiunge template senza toccare quelli esistenti.
+_SCENARIO_TEMPLATES_DEFAULT = {
+    'jewelry_security': {
+        'name': 'Sicurezza Gioielleria',
+        'description': 'Monitoraggio completo per gioiellerie con detection persone',
+        'targets': ['people'],
+        'rules': {
+            'alert_on_person_entry': True,
+            'exclude_staff_hours': '09:00-18:00',
+            'high_confidence_threshold': 0.7
+        },
+        'database_preferences': {
+            'people': 'ultralytics'
+        }
+    },
+    'people_counting': {
+        'name': 'Conteggio Presenze',
+        'description': 'Conta il numero di persone presenti nell\'area',
+        'targets': ['people'],
+        'rules': {
+            'count_entries_exits': True,
+            'max_occupancy': 50,
+            'ignore_staff': False
+        },
+        'database_preferences': {
+            'people': 'ultralytics'
+        }
+    },
+    'general_security': {
+        'name': 'Sicurezza Generale',
+        'description': 'Monitoraggio sicurezza generale con detection persone',
+        'targets': ['people'],
+        'rules': {
+            'immediate_alert': True,
+            'track_movement': True,
+            'after_hours_alert': True
+        },
+        'database_preferences': {
+            'people': 'ultralytics'
+        }
+    },
+    'advanced_jewelry': {
+        'name': 'Gioielleria Avanzata',
+        'description': 'Sicurezza gioielleria con detection persone + gioielli (richiede modello custom)',
+        'targets': ['people', 'jewelry'],
+        'rules': {
+            'alert_on_person_entry': True,
+            'alert_on_jewelry_movement': True,
+            'high_value_threshold': 0.8
+        },
+        'database_preferences': {
+            'people': 'ultralytics',
+            'jewelry': 'local'
+        }
+    }
+}
+
+# Database disponibili con caratteristiche (condiviso tra istanze, da trattare in sola lettura)
+_AVAILABLE_DATABASES = {
+    'ultralytics': {
+        'name': 'Ultralytics Hub',
+        'description': 'Modelli pre-addestrati gratuiti (YOLO standard)',
+        'supported_targets': ['people', 'vehicles', 'general_objects'],
+        'pros': ['Gratuito', 'Veloce', 'Affidabile', 'Pronto all\'uso'],
+        'cons': ['Limitato a classi COCO', 'Non personalizzabile'],
+        'requires_internet': True,
+        'cost': 'Gratuito'
+    },
+    'local': {
+        'name': 'Database Locale',
+        'description': 'Modelli custom addestrati localmente',
+        'supported_targets': ['jewelry', 'custom_objects', 'faces'],
+        'pros': ['Massima personalizzazione', 'Privacy totale', 'Veloce'],
+        'cons': ['Richiede training', 'Maintenance manuale'],
+        'requires_internet': False,
+        'cost': 'Gratuito (dopo training)'
+    },
+    'roboflow': {
+        'name': 'Roboflow Universe',
+        'description': 'Database comunitario con modelli specializzati',
+        'supported_targets': ['custom', 'specialized'],
+        'pros': ['Ampia varietà', 'Modelli specializzati', 'Community'],
+        'cons': ['Qualità variabile', 'Alcuni a pagamento'],
+        'requires_internet': True,
+        'cost': 'Freemium'
+    }
+}
+
+
 class ScenarioConfigurator:
     """
     Configuratore avanzato per scenari di detection
     """
     
+    # Target accettati in validazione (tupla per l'ordine nei messaggi, frozenset per lookup O(1))
+    _SUPPORTED_TARGET_NAMES = ('people', 'jewelry', 'faces', 'bags', 'weapons', 'vehicles')
+    _SUPPORTED_TARGETS = frozenset(_SUPPORTED_TARGET_NAMES)
+    # Campi obbligatori, nell'ordine dei messaggi di errore
+    _REQUIRED_FIELDS = ('name', 'targets', 'rules')
+    
+    __slots__ = (
+        'detection_system', 'logger', 'scenario_templates', 'available_databases',
+        '_jewelry_model_path', '_jewelry_model_mtime_ns', '_jewelry_model_checked_at',
+        '_cached_scenario_status'
+    )
+    
     def __init__(self, detection_system):
         self.detection_system = detection_system
         self.logger = logging.getLogger('ScenarioConfigurator')
         
+        # Stato del modello jewelry custom, ricontrollato al massimo ogni _JEWELRY_MODEL_CHECK_TTL s
+        self._jewelry_model_path = Path('models/custom/jewelry_yolo11.pt')
+        self._jewelry_model_mtime_ns = None
+        self._jewelry_model_checked_at = float('-inf')
+        
+        # Cache LRU dello stato scenari, chiave (nome scenario, mtime modello jewelry)
+        self._cached_scenario_status = functools.lru_cache(maxsize=128)(self._build_scenario_status)
+        
         # Template di scenari pre-configurati
-        self.scenario_templates = {
-            'jewelry_security': {
-                'name': 'Sicurezza Gioielleria',
-                'description': 'Monitoraggio completo per gioiellerie con detection persone',
-                'targets': ['people'],
-                'rules': {
-                    'alert_on_person_entry': True,
-                    'exclude_staff_hours': '09:00-18:00',
-                    'high_confidence_threshold': 0.7
-                },
-                'database_preferences': {
-                    'people': 'ultralytics'
-                }
-            },
-            'people_counting': {
-                'name': 'Conteggio Presenze',
-                'description': 'Conta il numero di persone presenti nell\'area',
-                'targets': ['people'],
-                'rules': {
-                    'count_entries_exits': True,
-                    'max_occupancy': 50,
-                    'ignore_staff': False
-                },
-                'database_preferences': {
-                    'people': 'ultralytics'
-                }
-            },
-            'general_security': {
-                'name': 'Sicurezza Generale',
-                'description': 'Monitoraggio sicurezza generale con detection persone',
-                'targets': ['people'],
-                'rules': {
-                    'immediate_alert': True,
-                    'track_movement': True,
-                    'after_hours_alert': True
-                },
-                'database_preferences': {
-                    'people': 'ultralytics'
-                }
-            },
-            'advanced_jewelry': {
-                'name': 'Gioielleria Avanzata',
-                'description': 'Sicurezza gioielleria con detection persone + gioielli (richiede modello custom)',
-                'targets': ['people', 'jewelry'],
-                'rules': {
-                    'alert_on_person_entry': True,
-                    'alert_on_jewelry_movement': True,
-                    'high_value_threshold': 0.8
-                },
-                'database_preferences': {
-                    'people': 'ultralytics',
-                    'jewelry': 'local'
-                }
-            }
-        }
+        self.scenario_templates = dict(_SCENARIO_TEMPLATES_DEFAULT)
         
         # Database disponibili con caratteristiche
-        self.available_databases = {
-            'ultralytics': {
-                'name': 'Ultralytics Hub',
-                'description': 'Modelli pre-addestrati gratuiti (YOLO standard)',
-                'supported_targets': ['people', 'vehicles', 'general_objects'],
-                'pros': ['Gratuito', 'Veloce', 'Affidabile', 'Pronto all\'uso'],
-                'cons': ['Limitato a classi COCO', 'Non personalizzabile'],
-                'requires_internet': True,
-                'cost': 'Gratuito'
-            },
-            'local': {
-                'name': 'Database Locale',
-                'description': 'Modelli custom addestrati localmente',
-                'supported_targets': ['jewelry', 'custom_objects', 'faces'],
-                'pros': ['Massima personalizzazione', 'Privacy totale', 'Veloce'],
-                'cons': ['Richiede training', 'Maintenance manuale'],
-                'requires_internet': False,
-                'cost': 'Gratuito (dopo training)'
-            },
-            'roboflow': {
-                'name': 'Roboflow Universe',
-                'description': 'Database comunitario con modelli specializzati',
-                'supported_targets': ['custom', 'specialized'],
-                'pros': ['Ampia varietà', 'Modelli specializzati', 'Community'],
-                'cons': ['Qualità variabile', 'Alcuni a pagamento'],
-                'requires_internet': True,
-                'cost': 'Freemium'
-            }
-        }
+        self.available_databases = _AVAILABLE_DATABASES
         
     def get_scenario_templates(self) -> Dict[str, Any]:
         """Restituisce template scenari disponibili"""
@@ -117,17 +270,18 @@ class ScenarioConfigurator:
     def create_custom_scenario(self, config: Dict) -> Dict[str, Any]:
         """Crea scenario personalizzato"""
         try:
-            # Validazione configurazione
-            validation_result = self._validate_scenario_config(config)
-            if not validation_result['valid']:
-                return {'success': False, 'errors': validation_result['errors']}
+            # Validazione configurazione: messaggi dettagliati solo se il controllo rapido fallisce
+            if not self._quick_validate(config):
+                validation_result = self._validate_scenario_config(config)
+                if not validation_result['valid']:
+                    return {'success': False, 'errors': validation_result['errors']}
             
             # Crea scenario
-            scenario_name = config['name'].lower().replace(' ', '_')
+            scenario_name = _slugify_scenario_name(config['name'])
             
             scenario_data = {
                 'description': config.get('description', f'Scenario personalizzato: {config["name"]}'),
-                'targets': config['targets'],
+                'targets': [sys.intern(t) for t in config['targets']],
                 'rules': config['rules'],
                 'database_preferences': config.get('database_preferences', {})
             }
@@ -136,13 +290,8 @@ class ScenarioConfigurator:
             self._save_custom_scenario(scenario_name, scenario_data)
             
             # Aggiungi ai template disponibili
-            self.scenario_templates[scenario_name] = {
-                'name': config['name'],
-                'description': scenario_data['description'],
-                'targets': scenario_data['targets'],
-                'rules': scenario_data['rules'],
-                'database_preferences': scenario_data['database_preferences']
-            }
+            self.scenario_templates[scenario_name] = {'name': config['name'], **scenario_data}
+            self.clear_scenario_status_cache()
             
             return {
                 'success': True,
@@ -151,16 +300,25 @@ class ScenarioConfigurator:
             }
             
         except Exception as e:
-            self.logger.error(f"Error creating custom scenario: {e}")
+            self.logger.error("Error creating custom scenario: %s", e, exc_info=True)
             return {'success': False, 'error': str(e)}
     
+    def _quick_validate(self, config: Dict) -> bool:
+        """
+        Unico fast path della validazione: stesse regole di _validate_scenario_config,
+        ma si ferma al primo errore senza costruire messaggi
+        """
+        return ('name' in config and 'targets' in config and 'rules' in config
+                and isinstance(config['targets'], list) and bool(config['targets'])
+                and all(isinstance(t, str) and t in self._SUPPORTED_TARGETS for t in config['targets'])
+                and isinstance(config['rules'], dict))
+    
     def _validate_scenario_config(self, config: Dict) -> Dict[str, Any]:
         """Valida configurazione scenario"""
         errors = []
         
         # Campi obbligatori
-        required_fields = ['name', 'targets', 'rules']
-        for field in required_fields:
+        for field in self._REQUIRED_FIELDS:
             if field not in config:
                 errors.append(f"Campo obbligatorio mancante: {field}")
         
@@ -170,11 +328,11 @@ class ScenarioConfigurator:
                 errors.append("Targets deve essere una lista non vuota")
             
             # Verifica targets supportati
-            supported_targets = ['people', 'jewelry', 'faces', 'bags', 'weapons', 'vehicles']
-            
-            for target in config['targets']:
-                if target not in supported_targets:
-                    errors.append(f"Target '{target}' non supportato. Supportati: {supported_targets}")
+            # Target non stringa (liste, dict) non sono hashabili: non supportati
+            bad = [t for t in config['targets']
+                   if not (isinstance(t, str) and t in self._SUPPORTED_TARGETS)]
+            for target in bad:
+                errors.append(f"Target '{target}' non supportato. Supportati: {list(self._SUPPORTED_TARGET_NAMES)}")
         
         # Validazione regole
         if 'rules' in config:
@@ -192,26 +350,48 @@ class ScenarioConfigurator:
         scenarios_dir.mkdir(parents=True, exist_ok=True)
         
         scenario_file = scenarios_dir / f'{scenario_name}.json'
-        with open(scenario_file, 'w') as f:
-            json.dump(scenario_data, f, indent=2)
+        if ORJSON_AVAILABLE:
+            buf = orjson.dumps(scenario_data, option=orjson.OPT_INDENT_2)
+        else:
+            buf = json.dumps(scenario_data, indent=2).encode('utf-8')
+        _write_file_atomic(scenario_file, buf)
     
     def load_custom_scenarios(self) -> Dict[str, Any]:
         """Carica scenari personalizzati salvati"""
         custom_scenarios = {}
-        scenarios_dir = Path('config/custom_scenarios')
+        scenarios_dir = 'config/custom_scenarios'
         
-        if scenarios_dir.exists():
-            for scenario_file in scenarios_dir.glob('*.json'):
-                try:
-                    with open(scenario_file, 'r') as f:
-                        scenario_data = json.load(f)
-                        scenario_name = scenario_file.stem
-                        custom_scenarios[scenario_name] = scenario_data
-                except Exception as e:
-                    self.logger.error(f"Error loading custom scenario {scenario_file}: {e}")
+        try:
+            with os.scandir(scenarios_dir) as it:
+                files = [e.path for e in it if e.name.endswith('.json') and e.is_file()]
+        except (FileNotFoundError, NotADirectoryError):
+            return custom_scenarios
+        
+        results = None
+        if len(files) >= _BULK_PARSE_MIN_FILES:
+            results = _bulk_parse_scenario_files(files)
+        
+        if results is None:
+            if len(files) > 1:
+                with ThreadPoolExecutor(max_workers=min(_MAX_LOAD_WORKERS, len(files))) as ex:
+                    results = list(ex.map(self._load_one_scenario, files))
+            else:
+                results = [self._load_one_scenario(p) for p in files]
+        
+        for scenario_file, scenario_data in zip(files, results):
+            if scenario_data is not None:
+                custom_scenarios[Path(scenario_file).stem] = scenario_data
         
         return custom_scenarios
     
+    def _load_one_scenario(self, scenario_file: str) -> Optional[Dict[str, Any]]:
+        """Carica un singolo file scenario, None in caso di errore"""
+        try:
+            return _load_scenario_file(scenario_file)
+        except Exception as e:
+            self.logger.error("Error loading custom scenario %s: %s", scenario_file, e)
+            return None
+    
     def get_target_configuration_options(self) -> Dict[str, Any]:
         """Opzioni di configurazione per ogni target"""
         return {
@@ -272,36 +452,8 @@ class ScenarioConfigurator:
             security_level = requirements.get('security_level', 'medium')
             budget = requirements.get('budget', 'medium')
             
-            recommendations = []
-            
-            # Raccomandazioni basate su location
-            if location_type == 'jewelry_store':
-                if budget == 'low':
-                    recommendations.append({
-                        'scenario': 'jewelry_security',
-                        'confidence': 0.9,
-                        'reason': 'Perfetto per gioiellerie con budget limitato - usa solo detection persone'
-                    })
-                else:
-                    recommendations.append({
-                        'scenario': 'advanced_jewelry',
-                        'confidence': 0.95,
-                        'reason': 'Massima sicurezza per gioiellerie - richiede training modello jewelry'
-                    })
-            
-            elif location_type == 'office':
-                recommendations.append({
-                    'scenario': 'people_counting',
-                    'confidence': 0.8,
-                    'reason': 'Ideale per uffici - monitora presenze e accessi'
-                })
-            
-            else:  # general
-                recommendations.append({
-                    'scenario': 'general_security',
-                    'confidence': 0.7,
-                    'reason': 'Configurazione versatile per uso generale'
-                })
+            rec = _lookup_recommendation(location_type, budget)
+            recommendations = [dict(rec)]  # Copia: la tabella e' condivisa
             
             return {
                 'success': True,
@@ -317,13 +469,53 @@ class ScenarioConfigurator:
         location = requirements.get('location', 'generale')
         budget = requirements.get('budget', 'medio')
         
-        explanation = f"Basato su: Location {location}, Budget {budget}. "
-        explanation += "Le raccomandazioni privilegiano soluzioni pronte all'uso con YOLO standard per massima affidabilità."
-        
-        return explanation
+        try:
+            return _explain(location, budget)
+        except TypeError:
+            # Valori non hashabili: niente cache
+            return _EXPLANATION_TEMPLATE.format(location=location, budget=budget)
     
     def get_scenario_status(self, scenario_name: str) -> Dict[str, Any]:
-        """Stato di un scenario specifico"""
+        """Stato di un scenario specifico (memoizzato finche' il modello jewelry non cambia)"""
+        scenario = self.scenario_templates.get(scenario_name)
+        if not scenario:
+            return {'exists': False}
+        
+        # Fast path: scenari solo persone, YOLO standard sempre disponibile
+        if tuple(scenario['targets']) == ('people',):
+            return {
+                'exists': True,
+                'name': scenario['name'],
+                'description': scenario['description'],
+                'targets': scenario['targets'],
+                'models_available': {'people': True},
+                'ready_to_use': True,
+                'missing_models': []
+            }
+        
+        status = self._cached_scenario_status(scenario_name, self._get_jewelry_model_mtime_ns())
+        # Copia: il risultato in cache non deve essere modificabile dal chiamante
+        return {key: value.copy() if isinstance(value, (dict, list)) else value
+                for key, value in status.items()}
+    
+    def _get_jewelry_model_mtime_ns(self) -> Optional[int]:
+        """mtime del modello jewelry (None se assente), con stat limitato da TTL"""
+        now = time.monotonic()
+        if now - self._jewelry_model_checked_at > _JEWELRY_MODEL_CHECK_TTL:
+            try:
+                self._jewelry_model_mtime_ns = self._jewelry_model_path.stat().st_mtime_ns
+            except OSError:
+                self._jewelry_model_mtime_ns = None
+            self._jewelry_model_checked_at = now
+        return self._jewelry_model_mtime_ns
+    
+    def clear_scenario_status_cache(self):
+        """Invalida la cache di get_scenario_status (es. dopo modifiche ai template)"""
+        self._cached_scenario_status.cache_clear()
+        self._jewelry_model_checked_at = float('-inf')
+    
+    def _build_scenario_status(self, scenario_name: str, jewelry_mtime_ns: Optional[int]) -> Dict[str, Any]:
+        """Calcola lo stato di uno scenario; jewelry_mtime_ns e' None se il modello non esiste"""
         scenario = self.scenario_templates.get(scenario_name)
         if not scenario:
             return {'exists': False}
@@ -334,9 +526,8 @@ class ScenarioConfigurator:
             if target == 'people':
                 models_available[target] = True  # YOLO standard sempre disponibile
             elif target == 'jewelry':
-                # Verifica se esiste modello jewelry custom
-                jewelry_model_path = Path('models/custom/jewelry_yolo11.pt')
-                models_available[target] = jewelry_model_path.exists()
+                # Modello jewelry custom presente se ne conosciamo l'mtime
+                models_available[target] = jewelry_mtime_ns is not None
             else:
                 models_available[target] = False  # Altri target non ancora implementati
         
@@ -351,11 +542,123 @@ class ScenarioConfigurator:
         }
 
 
+# Raccomandazioni scenario per (location, budget); budget None vale per ogni budget
+_RECOMMENDATIONS = {
+    ('jewelry_store', 'low'): {
+        'scenario': 'jewelry_security',
+        'confidence': 0.9,
+        'reason': 'Perfetto per gioiellerie con budget limitato - usa solo detection persone'
+    },
+    ('jewelry_store', None): {
+        'scenario': 'advanced_jewelry',
+        'confidence': 0.95,
+        'reason': 'Massima sicurezza per gioiellerie - richiede training modello jewelry'
+    },
+    ('office', None): {
+        'scenario': 'people_counting',
+        'confidence': 0.8,
+        'reason': 'Ideale per uffici - monitora presenze e accessi'
+    }
+}
+
+_DEFAULT_RECOMMENDATION = {
+    'scenario': 'general_security',
+    'confidence': 0.7,
+    'reason': 'Configurazione versatile per uso generale'
+}
+
+
+def _lookup_recommendation(location_type, budget) -> Dict[str, Any]:
+    """Raccomandazione per (location, budget), poi solo location, poi default"""
+    for key in ((location_type, budget), (location_type, None)):
+        try:
+            rec = _RECOMMENDATIONS.get(key)
+        except TypeError:
+            # Valori non hashabili (liste/dict dal JSON): nessuna voce corrisponde
+            continue
+        if rec:
+            return rec
+    return _DEFAULT_RECOMMENDATION
+
+
+_EXPLANATION_TEMPLATE = (
+    "Basato su: Location {location}, Budget {budget}. "
+    "Le raccomandazioni privilegiano soluzioni pronte all'uso con YOLO standard per massima affidabilità."
+)
+
+
+@functools.lru_cache(maxsize=64)
+def _explain(location: str, budget: str) -> str:
+    """Testo di spiegazione, dipende solo da location e budget"""
+    return _EXPLANATION_TEMPLATE.format(location=location, budget=budget)
+
+
+# Step statici del wizard: costruiti una volta sola, da trattare in sola lettura
+_WIZARD_BASIC_INFO = {
+    'title': 'Informazioni Base',
+    'description': 'Nome e descrizione del scenario',
+    'fields': [
+        {'name': 'scenario_name', 'type': 'text', 'required': True, 'label': 'Nome Scenario'},
+        {'name': 'description', 'type': 'textarea', 'required': False, 'label': 'Descrizione'},
+        {'name': 'security_level', 'type': 'select', 'required': True, 'label': 'Livello Sicurezza',
+         'options': ['basic', 'standard', 'high', 'maximum']}
+    ]
+}
+
+_WIZARD_LOCATION_TYPE = {
+    'title': 'Tipo di Location',
+    'description': 'Seleziona il tipo di ambiente da monitorare',
+    'fields': [
+        {'name': 'location', 'type': 'select', 'required': True, 'label': 'Tipo Location',
+         'options': ['jewelry_store', 'office', 'retail', 'warehouse', 'home', 'other']},
+        {'name': 'area_size', 'type': 'select', 'label': 'Dimensione Area',
+         'options': ['small', 'medium', 'large']},
+        {'name': 'indoor_outdoor', 'type': 'select', 'label': 'Ambiente',
+         'options': ['indoor', 'outdoor', 'mixed']}
+    ]
+}
+
+_WIZARD_TARGET_OPTIONS = [
+    {'value': 'people', 'label': 'Persone', 'available': True, 'recommended': True},
+    {'value': 'jewelry', 'label': 'Gioielli', 'available': False, 'note': 'Richiede modello custom'},
+    {'value': 'faces', 'label': 'Volti', 'available': False, 'note': 'In sviluppo'},
+    {'value': 'bags', 'label': 'Borse', 'available': False, 'note': 'In sviluppo'}
+]
+
+
+def _build_target_selection_step(previous_answers: Dict = None) -> Dict[str, Any]:
+    """Step selezione target: i suggerimenti dipendono dalle risposte precedenti"""
+    suggested_targets = ['people']  # Sempre suggerito
+    if previous_answers and previous_answers.get('location') == 'jewelry_store':
+        suggested_targets.append('jewelry')
+    
+    return {
+        'title': 'Selezione Target',
+        'description': 'Scegli cosa vuoi rilevare',
+        'suggested_targets': suggested_targets,
+        'fields': [
+            {'name': 'targets', 'type': 'checkbox_multiple', 'label': 'Targets da Rilevare',
+             'options': [dict(option) for option in _WIZARD_TARGET_OPTIONS],
+             'suggested': suggested_targets}
+        ]
+    }
+
+
+# Step name -> risposta statica oppure builder(previous_answers)
+_WIZARD_STEPS = {
+    'basic_info': _WIZARD_BASIC_INFO,
+    'location_type': _WIZARD_LOCATION_TYPE,
+    'target_selection': _build_target_selection_step
+}
+
+
 class ScenarioWizard:
     """
     Wizard per creare scenari step-by-step
     """
     
+    __slots__ = ('configurator', 'wizard_steps')
+    
     def __init__(self, configurator: ScenarioConfigurator):
         self.configurator = configurator
         self.wizard_steps = [
@@ -368,56 +671,10 @@ class ScenarioWizard:
         
     def get_wizard_step(self, step_name: str, previous_answers: Dict = None) -> Dict[str, Any]:
         """Restituisce configurazione per step wizard"""
-        
-        if step_name == 'basic_info':
-            return {
-                'title': 'Informazioni Base',
-                'description': 'Nome e descrizione del scenario',
-                'fields': [
-                    {'name': 'scenario_name', 'type': 'text', 'required': True, 'label': 'Nome Scenario'},
-                    {'name': 'description', 'type': 'textarea', 'required': False, 'label': 'Descrizione'},
-                    {'name': 'security_level', 'type': 'select', 'required': True, 'label': 'Livello Sicurezza',
-                     'options': ['basic', 'standard', 'high', 'maximum']}
-                ]
-            }
-        
-        elif step_name == 'location_type':
-            return {
-                'title': 'Tipo di Location',
-                'description': 'Seleziona il tipo di ambiente da monitorare',
-                'fields': [
-                    {'name': 'location', 'type': 'select', 'required': True, 'label': 'Tipo Location',
-                     'options': ['jewelry_store', 'office', 'retail', 'warehouse', 'home', 'other']},
-                    {'name': 'area_size', 'type': 'select', 'label': 'Dimensione Area',
-                     'options': ['small', 'medium', 'large']},
-                    {'name': 'indoor_outdoor', 'type': 'select', 'label': 'Ambiente',
-                     'options': ['indoor', 'outdoor', 'mixed']}
-                ]
-            }
-        
-        elif step_name == 'target_selection':
-            # Suggerimenti basati su risposte precedenti
-            suggested_targets = ['people']  # Sempre suggerito
-            if previous_answers and previous_answers.get('location') == 'jewelry_store':
-                suggested_targets.append('jewelry')
-            
-            return {
-                'title': 'Selezione Target',
-                'description': 'Scegli cosa vuoi rilevare',
-                'suggested_targets': suggested_targets,
-                'fields': [
-                    {'name': 'targets', 'type': 'checkbox_multiple', 'label': 'Targets da Rilevare',
-                     'options': [
-                         {'value': 'people', 'label': 'Persone', 'available': True, 'recommended': True},
-                         {'value': 'jewelry', 'label': 'Gioielli', 'available': False, 'note': 'Richiede modello custom'},
-                         {'value': 'faces', 'label': 'Volti', 'available': False, 'note': 'In sviluppo'},
-                         {'value': 'bags', 'label': 'Borse', 'available': False, 'note': 'In sviluppo'}
-                     ],
-                     'suggested': suggested_targets}
-                ]
-            }
-        
-        return {'error': 'Step non trovato'}
+        entry = _WIZARD_STEPS.get(step_name)
+        if entry is None:
+            return {'error': 'Step non trovato'}
+        return entry(previous_answers) if callable(entry) else entry
 
 
 if __name__ == "__main__":